@@ -1,15 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Query, File, UploadFile
-from fastapi.responses import JSONResponse, Response
+from fastapi import APIRouter, Depends, HTTPException, Request, Query, Path, File, UploadFile, WebSocket, Header
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from database import get_db
+from database import get_db, get_pool_stats
 from models import *
-from services import PixelService, StatsService, AdminService, AuthService, UserService
+from services import PixelService, StatsService, AuthService, UserService, TILE_FRAME_HEADER, PROFILE_PICTURE_SIZES
 from config import settings
+from canvas_buffer import canvas_buffer
+from canvas_export import canvas_exporter, encode_canvas, EXPORT_MEDIA_TYPES
+from placement_history import placement_history, KEYFRAME_REPLAY_MARGIN
+from change_log import change_log
+from live_updates import live_updates
+from identity_cache import AuthenticatedUser
+from cpu_pool import cpu_pool
+from canvas_jobs import canvas_jobs
+from shared_canvas import is_multi_worker
+from health import health
+import asyncio
 import time
-import psutil
-import hashlib
-from typing import Optional, Dict, List
+from typing import Optional
 from sqlalchemy import text
 
 router = APIRouter()
@@ -26,7 +35,7 @@ async def get_current_user(
     request: Request,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
     db: AsyncSession = Depends(get_db)
-) -> Optional[User]:
+) -> Optional[AuthenticatedUser]:
     """Get current user from JWT token (optional)"""
     if not credentials:
         return None
@@ -41,7 +50,7 @@ async def get_current_user_required(
     request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncSession = Depends(get_db)
-) -> User:
+) -> AuthenticatedUser:
     """Get current user from JWT token (required)"""
     if not credentials:
         raise HTTPException(status_code=401, detail="Authentication required")
@@ -57,7 +66,7 @@ async def get_current_user_required(
 async def set_pixel(
     pixel_data: PixelRequest,
     request: Request,
-    current_user: Optional[User] = Depends(get_current_user),
+    current_user: Optional[AuthenticatedUser] = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Set a pixel on the canvas with checksum verification"""
@@ -102,13 +111,37 @@ async def set_raw_pixel(
     
     return {"success": True, "message": "Pixel set successfully"}
 
+@router.post("/pixels/raw", response_model=dict)
+async def set_raw_pixels(
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """Set a batch of pixels in one request - for bots.
+
+    Accepts JSON {"pixels": [[x, y, r, g, b], ...]} or an application/octet-stream
+    body of packed 7-byte records (x, y as little-endian u16, then r, g, b).
+    """
+    ip_address = get_client_ip(request)
+    
+    pixels, error = PixelService.parse_raw_pixel_batch(await request.body(), request.headers.get("content-type", ""))
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    
+    result, error = await PixelService.set_raw_pixels(db, pixels, ip_address)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    
+    return result
+
 @router.get("/state", response_model=StateResponse)
 @router.post("/state", response_model=StateResponse)
 async def get_canvas_state(
+    request: Request,
     state_request: Optional[StateRequest] = None,
     tile_x: Optional[int] = Query(None),
     tile_y: Optional[int] = Query(None),
     checksum: Optional[str] = Query(None),
+    format: Optional[str] = Query(None, regex="^(json|binary)$", description="Tile encoding: json or binary"),
     db: AsyncSession = Depends(get_db)
 ):
     """Get canvas state/tiles"""
@@ -117,6 +150,7 @@ async def get_canvas_state(
         tile_x = state_request.tile_x
         tile_y = state_request.tile_y
         checksum = state_request.checksum
+        format = state_request.format or format
     
     if tile_x is None or tile_y is None:
         raise HTTPException(status_code=400, detail="tile_x and tile_y are required")
@@ -125,23 +159,25 @@ async def get_canvas_state(
     current_checksum = await PixelService.calculate_tile_checksum(db, tile_x, tile_y)
     checksum_match = (checksum == current_checksum) if checksum else False
     
-    tiles = []
-    if not checksum_match:
-        # Get tile data
-        pixels = await PixelService.get_tile_pixels(db, tile_x, tile_y)
+    # Binary tiles are negotiated with ?format=binary or an octet-stream Accept header
+    if format == "binary" or (format is None and "application/octet-stream" in request.headers.get("accept", "")):
+        if not canvas_buffer.has_tile(tile_x, tile_y):
+            raise HTTPException(status_code=400, detail="Tile out of bounds")
         
-        # Create base64 encoded tile data
-        tile_data = []
-        for pixel in pixels:
-            tile_data.append(f"{pixel.x},{pixel.y},{pixel.r},{pixel.g},{pixel.b}")
-        
-        import base64
-        encoded_data = base64.b64encode("|".join(tile_data).encode()).decode()
+        etag = f'"{current_checksum}"'
+        headers = {"X-Tile-Checksum": current_checksum, "ETag": etag, "Vary": "Accept"}
+        if checksum_match or request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
         
+        tile_bytes = await PixelService.get_tile_bytes(db, tile_x, tile_y)
+        return Response(content=tile_bytes, media_type="application/octet-stream", headers=headers)
+    
+    tiles = []
+    if not checksum_match:
         tiles.append(TileData(
             tile_x=tile_x,
             tile_y=tile_y,
-            data=encoded_data,
+            data=await PixelService.get_tile_text(db, tile_x, tile_y),
             checksum=current_checksum
         ))
     
@@ -153,31 +189,76 @@ async def get_canvas_state(
         tiles=tiles
     )
 
+@router.post("/tiles", response_model=TilesResponse)
+async def get_tiles(
+    tiles_request: TilesRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """Get many tiles in one request, skipping those whose checksum the client already has.
+
+    Tiles nearest (center_x, center_y) come first. With stream=true, JSON tiles are sent
+    as newline-delimited TileData objects as soon as each is ready. The binary format is
+    always streamed as frames of: u32 frame length, 16-byte checksum, encoded tile.
+    """
+    tiles = PixelService.select_tiles(tiles_request)
+    
+    if tiles_request.format == "binary":
+        async def binary_frames():
+            async for tile_x, tile_y, checksum, payload in PixelService.iter_changed_tiles(db, tiles, tiles_request.checksums, binary=True):
+                if payload is not None:
+                    yield TILE_FRAME_HEADER.pack(TILE_FRAME_HEADER.size - 4 + len(payload), checksum.encode()) + payload
+        return StreamingResponse(binary_frames(), media_type="application/octet-stream")
+    
+    if tiles_request.stream:
+        async def json_lines():
+            async for tile_x, tile_y, checksum, payload in PixelService.iter_changed_tiles(db, tiles, tiles_request.checksums):
+                if payload is not None:
+                    yield TileData(tile_x=tile_x, tile_y=tile_y, data=payload, checksum=checksum).json() + "\n"
+        return StreamingResponse(json_lines(), media_type="application/x-ndjson")
+    
+    # Taken first, so changes made while the tiles are read are replayed by /updates
+    cursor = change_log.cursor
+    changed = []
+    unchanged = []
+    async for tile_x, tile_y, checksum, payload in PixelService.iter_changed_tiles(db, tiles, tiles_request.checksums):
+        if payload is None:
+            unchanged.append(f"{tile_x},{tile_y}")
+        else:
+            changed.append(TileData(tile_x=tile_x, tile_y=tile_y, data=payload, checksum=checksum))
+    
+    return TilesResponse(
+        canvas_width=settings.canvas_width,
+        canvas_height=settings.canvas_height,
+        tile_size=settings.tile_size,
+        tiles=changed,
+        unchanged=unchanged,
+        cursor=cursor
+    )
+
+@router.get("/updates")
 @router.post("/updates")
 async def get_updates(
-    request: Request,
-    since: Optional[int] = Query(None, description="Timestamp to get updates since"),
-    current_user: Optional[User] = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    updates_request: Optional[UpdatesRequest] = None,
+    since: Optional[int] = Query(None, description="Cursor returned by the previous /updates call"),
+    wait: float = Query(0, ge=0, description="Long-poll: seconds to hold the request until something changes")
 ):
-    """Get pixel updates since a given timestamp"""
-    try:
-        # For now, return empty updates - this endpoint is called by frontend
-        # but the current implementation doesn't use incremental updates
-        return {
-            "success": True,
-            "pixels": [],
-            "timestamp": int(time.time()),
-            "changedTiles": {},
-            "tileChecksums": {}
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to get updates: {str(e)}")
+    """Get pixel updates since a change log cursor"""
+    checksums = updates_request.checksums if updates_request else {}
+    
+    # Long-poll mode holds the request without a DB session until a change arrives
+    await change_log.wait(since, min(wait, settings.long_poll_timeout))
+    
+    return PixelService.get_updates(since, checksums)
+
+@router.websocket("/ws")
+async def live_updates_socket(websocket: WebSocket):
+    """Push pixel updates to the client as batched frames"""
+    await live_updates.serve(websocket)
 
 @router.get("/stats", response_model=UserStatsResponse)
 async def get_stats(
     request: Request,
-    current_user: Optional[User] = Depends(get_current_user),
+    current_user: Optional[AuthenticatedUser] = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Get user and canvas statistics"""
@@ -188,30 +269,86 @@ async def get_stats(
 
 @router.get("/canvas")
 async def export_canvas(
+    request: Request,
     format: str = Query("json", description="Export format: json, png, or raw"),
     db: AsyncSession = Depends(get_db)
 ):
     """Export canvas data"""
+    if format in EXPORT_MEDIA_TYPES:
+        if not canvas_buffer.loaded:
+            raise HTTPException(status_code=503, detail="Canvas is still loading")
+        
+        try:
+            data, etag, version = await canvas_exporter.export(format)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
+        
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "no-cache",
+            "X-Canvas-Version": str(version),
+            "X-Canvas-Width": str(settings.canvas_width),
+            "X-Canvas-Height": str(settings.canvas_height)
+        }
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return Response(content=data, media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
+    
+    if format != "json":
+        raise HTTPException(status_code=400, detail="Unsupported format. Use 'json', 'png' or 'raw'.")
+    
     try:
-        if format == "json":
-            # Get total pixel count for simple export
-            result = await db.execute(text("SELECT COUNT(*) FROM pixels"))
-            pixel_count = result.scalar() or 0
-            
-            return {
-                "success": True,
-                "format": "json",
-                "pixel_count": pixel_count,
-                "canvas_width": settings.canvas_width,
-                "canvas_height": settings.canvas_height,
-                "tile_size": settings.tile_size
-            }
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported format. Use 'json'.")
+        # Get total pixel count for simple export
+        result = await db.execute(text("SELECT COUNT(*) FROM pixels"))
+        pixel_count = result.scalar() or 0
+        
+        return {
+            "success": True,
+            "format": "json",
+            "pixel_count": pixel_count,
+            "canvas_width": settings.canvas_width,
+            "canvas_height": settings.canvas_height,
+            "tile_size": settings.tile_size
+        }
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
 
+@router.get("/canvas/at")
+async def export_canvas_at(
+    request: Request,
+    ts: int = Query(..., description="Unix timestamp to reconstruct the canvas at"),
+    format: str = Query("png", regex="^(png|raw)$", description="Export format: png or raw"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Export the canvas as it was at a point in time"""
+    now = int(time.time())
+    if ts > now:
+        raise HTTPException(status_code=400, detail="Timestamp is in the future")
+    
+    try:
+        frame = await placement_history.canvas_at(db, ts)
+        if frame is None:
+            raise HTTPException(status_code=404, detail="No canvas history at that time")
+        
+        loop = asyncio.get_running_loop()
+        data, etag = await loop.run_in_executor(None, encode_canvas, format, *frame)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
+    
+    # Late placements can still land in the last few seconds; older history is fixed
+    settled = ts < now - KEYFRAME_REPLAY_MARGIN
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=86400" if settled else "no-cache",
+        "X-Canvas-Timestamp": str(ts)
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
+
 # Utility endpoints
 @router.get("/ip")
 async def get_ip(request: Request):
@@ -228,46 +365,79 @@ async def get_ip(request: Request):
     return {"ip": masked_ip}
 
 @router.get("/monitor", response_model=HealthResponse)
-async def monitor(db: AsyncSession = Depends(get_db)):
+async def monitor():
     """System health monitoring"""
-    try:
-        # Test database connection
-        await db.execute(text("SELECT 1"))
-        db_status = "healthy"
-    except Exception:
-        db_status = "unhealthy"
-    
-    # Get system info
-    memory = psutil.virtual_memory()
-    uptime = time.time() - psutil.boot_time()
-    
+    # Database and memory figures come from the periodic health check, not a query per probe
     return HealthResponse(
-        status="healthy" if db_status == "healthy" else "degraded",
-        uptime=uptime,
-        memory_usage={
-            "total": memory.total,
-            "available": memory.available,
-            "percent": memory.percent
-        },
-        database_status=db_status
+        status="healthy" if health.database_status == "healthy" else "degraded",
+        uptime=time.time() - health.boot_time,
+        memory_usage=health.memory_usage,
+        database_status=health.database_status,
+        database_pool=get_pool_stats(),
+        cpu_pool=cpu_pool.stats()
     )
 
 # Admin endpoints
+def require_single_worker():
+    """Canvas jobs and their progress live in one process, so several workers can't share them"""
+    if is_multi_worker():
+        raise HTTPException(status_code=501, detail="Canvas jobs are only available with a single worker (WORKERS=1)")
+
 @router.post("/admin/scramble")
-async def admin_scramble(
-    request_data: AdminScrambleRequest,
-    db: AsyncSession = Depends(get_db)
-):
+async def admin_scramble(request_data: AdminScrambleRequest):
     """Scramble canvas - admin only"""
     if request_data.password != settings.admin_password:
         raise HTTPException(status_code=403, detail="Invalid admin password")
-    
-    success = await AdminService.scramble_canvas(db)
-    
-    if success:
-        return {"success": True, "message": "Canvas scrambled successfully"}
-    else:
-        raise HTTPException(status_code=500, detail="Failed to scramble canvas")
+    require_single_worker()
+    
+    # Clears the canvas and places 10k random pixels in the background
+    region, _ = canvas_jobs.resolve_region(0, 0, None, None)
+    job, error = canvas_jobs.scramble(region, 10000, True, None)
+    if job is None:
+        raise HTTPException(status_code=409, detail=error)
+    return {"success": True, "message": "Canvas scramble started", "job": job.to_dict()}
+
+@router.post("/admin/canvas/jobs", status_code=202)
+async def admin_start_canvas_job(request_data: AdminCanvasJobRequest):
+    """Start a bulk fill, pattern, clear or scramble of a canvas region - admin only"""
+    if request_data.password != settings.admin_password:
+        raise HTTPException(status_code=403, detail="Invalid admin password")
+    require_single_worker()
+    if canvas_jobs.running() is not None:
+        raise HTTPException(status_code=409, detail="Another canvas job is running")
+    
+    region, error = canvas_jobs.resolve_region(request_data.x, request_data.y, request_data.width, request_data.height)
+    if region is not None:
+        if request_data.operation == "fill":
+            job, error = canvas_jobs.fill(region, request_data.colors[0])
+        elif request_data.operation == "pattern":
+            job, error = canvas_jobs.pattern(region, request_data.pattern, request_data.colors, request_data.cell_size)
+        elif request_data.operation == "clear":
+            job, error = canvas_jobs.clear(region)
+        else:
+            job, error = canvas_jobs.scramble(region, request_data.pixels, request_data.clear, request_data.seed)
+    if region is None or job is None:
+        raise HTTPException(status_code=400, detail=error)
+    return {"success": True, "job": job.to_dict()}
+
+@router.get("/admin/canvas/jobs")
+async def admin_list_canvas_jobs(x_admin_password: str = Header(...)):
+    """Running and recent canvas jobs - admin only"""
+    if x_admin_password != settings.admin_password:
+        raise HTTPException(status_code=403, detail="Invalid admin password")
+    require_single_worker()
+    return {"jobs": [job.to_dict() for job in canvas_jobs.recent()]}
+
+@router.get("/admin/canvas/jobs/{job_id}")
+async def admin_get_canvas_job(job_id: str, x_admin_password: str = Header(...)):
+    """Progress of a canvas job - admin only"""
+    if x_admin_password != settings.admin_password:
+        raise HTTPException(status_code=403, detail="Invalid admin password")
+    require_single_worker()
+    job = canvas_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
 # Authentication endpoints
 @router.post("/auth/register", response_model=dict)
@@ -327,30 +497,33 @@ async def verify_email(
 
 @router.get("/auth/me", response_model=User)
 async def get_current_user_info(
-    current_user: User = Depends(get_current_user_required)
+    current_user: AuthenticatedUser = Depends(get_current_user_required),
+    db: AsyncSession = Depends(get_db)
 ):
     """Get current user information"""
-    # Add profile picture flag
-    user_dict = current_user.__dict__.copy()
-    user_dict["has_profile_picture"] = current_user.profile_picture is not None
+    profile = await UserService.get_profile(db, current_user.id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="User not found")
     
-    return User(**user_dict)
+    return profile
 
 # User profile endpoints
 @router.get("/user/profile", response_model=User)
 async def get_user_profile(
-    current_user: User = Depends(get_current_user_required)
+    current_user: AuthenticatedUser = Depends(get_current_user_required),
+    db: AsyncSession = Depends(get_db)
 ):
     """Get user profile"""
-    user_dict = current_user.__dict__.copy()
-    user_dict["has_profile_picture"] = current_user.profile_picture is not None
+    profile = await UserService.get_profile(db, current_user.id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="User not found")
     
-    return User(**user_dict)
+    return profile
 
 @router.put("/user/profile")
 async def update_user_profile(
     profile_data: UserProfile,
-    current_user: User = Depends(get_current_user_required),
+    current_user: AuthenticatedUser = Depends(get_current_user_required),
     db: AsyncSession = Depends(get_db)
 ):
     """Update user profile"""
@@ -364,7 +537,7 @@ async def update_user_profile(
 @router.post("/user/profile-picture")
 async def upload_profile_picture(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user_required),
+    current_user: AuthenticatedUser = Depends(get_current_user_required),
     db: AsyncSession = Depends(get_db)
 ):
     """Upload profile picture"""
@@ -380,22 +553,63 @@ async def upload_profile_picture(
     
     return {"success": True, "message": "Profile picture uploaded successfully"}
 
+def profile_picture_response(picture_hash: str, size: int, data: Optional[bytes], content_type: Optional[str], cache_control: str) -> Response:
+    etag = f'"{picture_hash}-{size}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if data is None:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=content_type, headers=headers)
+
 @router.get("/user/profile-picture/{user_id}")
 async def get_profile_picture(
+    request: Request,
     user_id: int,
+    size: int = Query(PROFILE_PICTURE_SIZES[0], description="Picture size in pixels"),
     db: AsyncSession = Depends(get_db)
 ):
     """Get user profile picture"""
-    picture_data, content_type = await UserService.get_profile_picture(db, user_id)
+    if size not in PROFILE_PICTURE_SIZES:
+        raise HTTPException(status_code=400, detail=f"Size must be one of {list(PROFILE_PICTURE_SIZES)}")
+    
+    picture_hash = await UserService.get_profile_picture_hash(db, user_id)
+    if not picture_hash:
+        raise HTTPException(status_code=404, detail="Profile picture not found")
+    
+    # The user's picture can change, so clients revalidate; unchanged ones cost a 304
+    cache_control = "no-cache"
+    if request.headers.get("if-none-match") == f'"{picture_hash}-{size}"':
+        return profile_picture_response(picture_hash, size, None, None, cache_control)
+    
+    picture_data, content_type = await UserService.get_profile_picture(db, picture_hash, size)
+    if not picture_data:
+        raise HTTPException(status_code=404, detail="Profile picture not found")
+    
+    return profile_picture_response(picture_hash, size, picture_data, content_type, cache_control)
+
+@router.get("/profile-pictures/{picture_hash}")
+async def get_profile_picture_by_hash(
+    request: Request,
+    picture_hash: str = Path(..., regex="^[0-9a-f]{64}$"),
+    size: int = Query(PROFILE_PICTURE_SIZES[0], description="Picture size in pixels"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get a profile picture by content hash; the response never changes"""
+    if size not in PROFILE_PICTURE_SIZES:
+        raise HTTPException(status_code=400, detail=f"Size must be one of {list(PROFILE_PICTURE_SIZES)}")
+    
+    cache_control = "public, max-age=31536000, immutable"
+    if request.headers.get("if-none-match") == f'"{picture_hash}-{size}"':
+        return profile_picture_response(picture_hash, size, None, None, cache_control)
     
+    picture_data, content_type = await UserService.get_profile_picture(db, picture_hash, size)
     if not picture_data:
         raise HTTPException(status_code=404, detail="Profile picture not found")
     
-    return Response(content=picture_data, media_type=content_type)
+    return profile_picture_response(picture_hash, size, picture_data, content_type, cache_control)
 
 @router.get("/user/stats", response_model=UserStats)
 async def get_user_statistics(
-    current_user: User = Depends(get_current_user_required),
+    current_user: AuthenticatedUser = Depends(get_current_user_required),
     db: AsyncSession = Depends(get_db)
 ):
     """Get detailed user statistics"""
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the backend's hot paths.
+
+Each benchmark runs against fixed synthetic canvases (empty, sparse, full)
+built from a seeded RNG, so runs on the same machine are comparable. Results
+are compared with a JSON baseline and the run fails when any benchmark is
+slower than its baseline by more than the threshold.
+
+    python benchmark.py --save                # record benchmark_baseline.json
+    python benchmark.py --threshold 0.2       # compare, exit 1 on a >20% regression
+    python benchmark.py --database            # include benchmarks that write to DATABASE_URL
+
+Baselines are machine specific: record them on the machine that compares them.
+Database benchmarks write pixels, so point DATABASE_URL at a scratch database.
+
+The committed benchmark_baseline.json covers only the benchmarks that run
+without Postgres: the JWT, identity cache and profile picture paths, and the
+tile checksum, tile encoding and in-memory set_pixel work on each synthetic
+canvas. user_stats, get_user_by_token_uncached and set_pixel (the real
+placement, SQL included) only run with --database and are compared only
+against a baseline recorded with --database --save. Without a baseline file
+the run fails unless --no-baseline is passed.
+"""
+
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+from jose import jwt
+from PIL import Image
+
+from config import settings
+from canvas_buffer import canvas_buffer
+from change_log import change_log
+from cpu_pool import process_profile_picture
+from identity_cache import identity_cache, AuthenticatedUser
+from models import PixelRequest
+from services import PixelService, StatsService, AuthService
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# Fraction of pixels set in each synthetic canvas
+CANVASES = {"empty": 0.0, "sparse": 0.02, "full": 1.0}
+
+SEED = 1234
+
+class Benchmark(NamedTuple):
+    name: str
+    func: Callable[[], Awaitable[None]]
+
+def synthetic_canvas(density: float):
+    """A deterministic canvas with the given fraction of pixels set"""
+    rng = np.random.default_rng(SEED)
+    rgb = rng.integers(0, 256, size=(settings.canvas_height, settings.canvas_width, 3), dtype=np.uint8)
+    present = rng.random((settings.canvas_height, settings.canvas_width)) < density
+    rgb[~present] = 0
+    return rgb, present
+
+def synthetic_picture() -> bytes:
+    """A deterministic noisy 800x800 PNG, roughly what users upload"""
+    rng = np.random.default_rng(SEED)
+    pixels = rng.integers(0, 256, size=(800, 800, 3), dtype=np.uint8)
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, format="PNG")
+    return output.getvalue()
+
+def cycle(values: List):
+    """Endless round-robin over values, so repeated calls don't hit one cached spot"""
+    while True:
+        yield from values
+
+def canvas_benchmarks(canvas: str) -> List[Benchmark]:
+    """Benchmarks over the in-memory canvas; canvas_buffer must hold the named canvas"""
+    tiles = cycle([(tile_x, tile_y) for tile_y in range(canvas_buffer.tiles_y) for tile_x in range(canvas_buffer.tiles_x)])
+    rng = np.random.default_rng(SEED)
+    writes = cycle([
+        tuple(int(value) for value in write)
+        for write in zip(
+            rng.integers(0, settings.canvas_width, 4096),
+            rng.integers(0, settings.canvas_height, 4096),
+            *rng.integers(0, 256, size=(3, 4096))
+        )
+    ])
+
+    async def tile_checksum():
+        await PixelService.calculate_tile_checksum(None, *next(tiles))
+
+    async def tile_encode_binary():
+        await PixelService.get_tile_bytes(None, *next(tiles))
+
+    async def tile_encode_json():
+        await PixelService.get_tile_text(None, *next(tiles))
+
+    async def set_pixel_in_memory():
+        # The work set_pixel does around its SQL statement
+        x, y, r, g, b = next(writes)
+        canvas_buffer.checksum_after_write(x, y, r, g, b)
+        canvas_buffer.set_pixel(x, y, r, g, b)
+        change_log.append(x, y, r, g, b)
+
+    return [
+        Benchmark(f"tile_checksum[{canvas}]", tile_checksum),
+        Benchmark(f"tile_encode_binary[{canvas}]", tile_encode_binary),
+        Benchmark(f"tile_encode_json[{canvas}]", tile_encode_json),
+        Benchmark(f"set_pixel_in_memory[{canvas}]", set_pixel_in_memory)
+    ]
+
+def standalone_benchmarks() -> List[Benchmark]:
+    token = AuthService.create_access_token({"user_id": 1, "username": "benchmark"})
+    cached_token = AuthService.create_access_token({"user_id": 2, "username": "benchmark-cached"})
+    identity_cache.put(cached_token, AuthenticatedUser(2, "benchmark-cached", None, True, True))
+    picture = synthetic_picture()
+
+    async def jwt_decode():
+        # The decode get_user_by_token does on an identity cache miss
+        jwt.decode(token, settings.secret_key, algorithms=[settings.jwt_algorithm])
+
+    async def get_user_by_token_cached():
+        await AuthService.get_user_by_token(None, cached_token)
+
+    async def profile_picture_pipeline():
+        process_profile_picture(picture)
+
+    return [
+        Benchmark("jwt_decode", jwt_decode),
+        Benchmark("get_user_by_token_cached", get_user_by_token_cached),
+        Benchmark("profile_picture_pipeline", profile_picture_pipeline)
+    ]
+
+def database_benchmarks(db) -> List[Benchmark]:
+    """Benchmarks that read from DATABASE_URL"""
+    token = AuthService.create_access_token({"user_id": 0, "username": "benchmark"})
+
+    async def user_stats():
+        await StatsService.get_user_stats(db, "bench-stats")
+
+    async def get_user_by_token_uncached():
+        identity_cache.invalidate_user(0)
+        await AuthService.get_user_by_token(db, token)
+
+    return [
+        Benchmark("user_stats", user_stats),
+        Benchmark("get_user_by_token_uncached", get_user_by_token_uncached)
+    ]
+
+def database_write_benchmarks(db, canvas: str) -> List[Benchmark]:
+    """Benchmarks that write to DATABASE_URL; canvas_buffer must hold the named canvas"""
+    rng = np.random.default_rng(SEED)
+    pixels = cycle([
+        PixelRequest(x=int(x), y=int(y), r=int(r), g=int(g), b=int(b))
+        for x, y, r, g, b in zip(
+            rng.integers(0, settings.canvas_width, 4096),
+            rng.integers(0, settings.canvas_height, 4096),
+            *rng.integers(0, 256, size=(3, 4096))
+        )
+    ])
+    counter = itertools.count()
+
+    async def set_pixel():
+        # A fresh address per call so the cooldown never rejects the placement
+        ip_address = f"bench-{canvas}-{os.getpid()}-{next(counter)}"
+        ok, error = await PixelService.set_pixel(db, next(pixels), ip_address)
+        if not ok:
+            raise RuntimeError(error)
+
+    return [Benchmark(f"set_pixel[{canvas}]", set_pixel)]
+
+async def measure(func: Callable[[], Awaitable[None]], repeat: int, min_time: float) -> Dict[str, float]:
+    """Per-call timings in microseconds: calibrate a round to min_time, then take repeat rounds"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        # Grow towards min_time, at most tenfold per step
+        number = max(number * 2, min(int(number * min_time / max(elapsed, 1e-9) * 1.1), number * 10))
+
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        rounds.append((time.perf_counter() - start) / number * 1e6)
+
+    return {
+        "median_us": round(statistics.median(rounds), 3),
+        "min_us": round(min(rounds), 3),
+        "max_us": round(max(rounds), 3),
+        "calls_per_round": number
+    }
+
+async def run_benchmarks(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    results = {}
+
+    async def run(benchmarks: List[Benchmark]):
+        for benchmark in benchmarks:
+            if args.filter and args.filter not in benchmark.name:
+                continue
+            results[benchmark.name] = await measure(benchmark.func, args.repeat, args.min_time)
+            print(f"{benchmark.name:<40} {results[benchmark.name]['median_us']:>12.3f} us", file=sys.stderr)
+
+    await run(standalone_benchmarks())
+
+    session = None
+    if args.database:
+        from database import async_session, init_db
+        await init_db()
+        session = async_session()
+
+    try:
+        if session is not None:
+            await run(database_benchmarks(session))
+        for canvas, density in CANVASES.items():
+            canvas_buffer.replace(*synthetic_canvas(density))
+            await run(canvas_benchmarks(canvas))
+            if session is not None:
+                canvas_buffer.replace(*synthetic_canvas(density))
+                await run(database_write_benchmarks(session, canvas))
+    finally:
+        if session is not None:
+            await session.close()
+    return results
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """Describe every benchmark slower than its baseline median by more than threshold"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["median_us"], result["median_us"]
+        change = (after - before) / before if before else 0.0
+        result["baseline_us"] = before
+        result["change"] = round(change, 4)
+        if change > threshold:
+            regressions.append(f"{name}: {before:.3f} us -> {after:.3f} us ({change:+.1%})")
+    return regressions
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Pixel Canvas micro-benchmarks")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save", action="store_true", help="Write the results as the new baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("BENCHMARK_THRESHOLD", "0.25")),
+                        help="Allowed slowdown over the baseline median before failing (0.25 = 25%%)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed rounds per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per timed round")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--database", action="store_true", help="Also run benchmarks against DATABASE_URL")
+    parser.add_argument("--output", help="Write the results JSON here")
+    parser.add_argument("--no-baseline", action="store_true", help="Don't fail when the baseline file is missing")
+    return parser.parse_args(argv)
+
+async def main(args: argparse.Namespace) -> int:
+    results = await run_benchmarks(args)
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+        regressions = []
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    elif args.no_baseline:
+        print(f"No baseline at {args.baseline}; run with --save to record one", file=sys.stderr)
+        regressions = []
+    else:
+        print(f"No baseline at {args.baseline}; run with --save to record one, or pass --no-baseline", file=sys.stderr)
+        regressions = None
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if regressions is None:
+        return 1
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
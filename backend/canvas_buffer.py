@@ -0,0 +1,294 @@
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from database import Pixel
+from config import settings
+import logging
+import struct
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Binary tile wire format: a fixed header followed by raw row-major RGB bytes
+# and, for partially filled tiles, a packed presence bitmask (MSB first).
+TILE_FORMAT_VERSION = 1
+TILE_HEADER = struct.Struct("<BHHHHB")  # version, tile_x, tile_y, width, height, flags
+TILE_FLAG_MASK = 0x01   # a presence bitmask follows the RGB data
+TILE_FLAG_EMPTY = 0x02  # no pixels set, nothing follows the header
+
+# Tile checksums are the sum (mod 2^64) of per-pixel digests, so a single
+# pixel write updates its tile's checksum in constant time.
+MASK64 = (1 << 64) - 1
+DIGEST_GAMMA = 0x9E3779B97F4A7C15
+DIGEST_MUL1 = 0xBF58476D1CE4E5B9
+DIGEST_MUL2 = 0x94D049BB133111EB
+
+def pixel_digest(x: int, y: int, r: int, g: int, b: int) -> int:
+    """64-bit digest of one pixel (splitmix64 over its packed fields)"""
+    z = (((x << 40) | (y << 24) | (r << 16) | (g << 8) | b) + DIGEST_GAMMA) & MASK64
+    z = ((z ^ (z >> 30)) * DIGEST_MUL1) & MASK64
+    z = ((z ^ (z >> 27)) * DIGEST_MUL2) & MASK64
+    return z ^ (z >> 31)
+
+def pixel_digests(xs: np.ndarray, ys: np.ndarray, rgb: np.ndarray) -> np.ndarray:
+    """Vectorized pixel_digest over coordinate and (..., 3) color arrays"""
+    rgb = rgb.astype(np.uint64)
+    z = (
+        (xs.astype(np.uint64) << np.uint64(40))
+        | (ys.astype(np.uint64) << np.uint64(24))
+        | (rgb[..., 0] << np.uint64(16))
+        | (rgb[..., 1] << np.uint64(8))
+        | rgb[..., 2]
+    )
+    with np.errstate(over="ignore"):
+        z = z + np.uint64(DIGEST_GAMMA)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(DIGEST_MUL1)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(DIGEST_MUL2)
+    return z ^ (z >> np.uint64(31))
+
+def format_checksum(value: int) -> str:
+    return f"{value:016x}"
+
+def encode_tile(tile_x: int, tile_y: int, rgb: np.ndarray, present: np.ndarray) -> bytes:
+    """Encode a tile in the binary wire format"""
+    height, width = present.shape
+    flags = 0
+    if not present.any():
+        return TILE_HEADER.pack(TILE_FORMAT_VERSION, tile_x, tile_y, width, height, TILE_FLAG_EMPTY)
+
+    body = [np.ascontiguousarray(rgb, dtype=np.uint8).tobytes()]
+    if not present.all():
+        flags |= TILE_FLAG_MASK
+        body.append(np.packbits(present, axis=None).tobytes())
+
+    return TILE_HEADER.pack(TILE_FORMAT_VERSION, tile_x, tile_y, width, height, flags) + b"".join(body)
+
+class CanvasBuffer:
+    """In-memory framebuffer of the whole canvas.
+
+    Postgres stays the durable store; this buffer is loaded once at startup
+    and kept current by the pixel write paths so tile reads never hit the DB.
+    In multi-worker mode the arrays are views of memory shared by every worker,
+    updated in place under a cross-process write lock; reads take no lock.
+    """
+
+    LOAD_BATCH_SIZE = 50000
+
+    def __init__(self, width: int, height: int, tile_size: int):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        # Indexed as [y, x] so tile slices are row-major like the canvas itself
+        self.rgb = np.zeros((height, width, 3), dtype=np.uint8)
+        self.present = np.zeros((height, width), dtype=bool)
+        self.tile_checksums = np.zeros((self.tiles_y, self.tiles_x), dtype=np.uint64)
+        self.loaded = False
+        self._write_lock = nullcontext()
+
+    @property
+    def tiles_x(self) -> int:
+        return (self.width + self.tile_size - 1) // self.tile_size
+
+    @property
+    def tiles_y(self) -> int:
+        return (self.height + self.tile_size - 1) // self.tile_size
+
+    def has_tile(self, tile_x: int, tile_y: int) -> bool:
+        return 0 <= tile_x < self.tiles_x and 0 <= tile_y < self.tiles_y
+
+    def tile_bounds(self, tile_x: int, tile_y: int) -> Tuple[int, int, int, int]:
+        """Get (x_start, y_start, x_end, y_end) of a tile clipped to the canvas"""
+        x_start = tile_x * self.tile_size
+        y_start = tile_y * self.tile_size
+        return (
+            x_start,
+            y_start,
+            min(x_start + self.tile_size, self.width),
+            min(y_start + self.tile_size, self.height)
+        )
+
+    async def load(self, db: AsyncSession, progress: Optional[Callable[[int], None]] = None):
+        """Load the full canvas from the pixels table, reporting the pixels read so far to progress"""
+        start_time = time.time()
+        rgb = np.zeros_like(self.rgb)
+        present = np.zeros_like(self.present)
+        count = 0
+
+        result = await db.stream(select(Pixel.x, Pixel.y, Pixel.r, Pixel.g, Pixel.b))
+        async for rows in result.partitions(self.LOAD_BATCH_SIZE):
+            data = np.array(rows, dtype=np.int32).reshape(-1, 5)
+            xs, ys = data[:, 0], data[:, 1]
+            in_bounds = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+            data = data[in_bounds]
+            rgb[data[:, 1], data[:, 0]] = data[:, 2:5]
+            present[data[:, 1], data[:, 0]] = True
+            count += len(data)
+            if progress is not None:
+                progress(count)
+
+        self.replace(rgb, present)
+        logger.info(f"Canvas buffer loaded {count} pixels in {time.time() - start_time:.2f}s")
+
+    def attach(self, rgb: np.ndarray, present: np.ndarray, tile_checksums: np.ndarray, write_lock):
+        """Use canvas arrays that other worker processes share (and have already loaded)"""
+        self.rgb = rgb
+        self.present = present
+        self.tile_checksums = tile_checksums
+        self._write_lock = write_lock
+        self.loaded = True
+
+    def replace(self, rgb: np.ndarray, present: np.ndarray):
+        """Copy in a whole canvas, e.g. a freshly loaded or synthetic one"""
+        with self._write_lock:
+            np.copyto(self.rgb, rgb)
+            np.copyto(self.present, present)
+            self._recompute_checksums()
+        self.loaded = True
+
+    def restore(self, rgb: np.ndarray, present: np.ndarray, tile_checksums: np.ndarray):
+        """Copy in a whole canvas together with its already computed tile checksums"""
+        with self._write_lock:
+            np.copyto(self.rgb, rgb)
+            np.copyto(self.present, present)
+            np.copyto(self.tile_checksums, tile_checksums)
+        self.loaded = True
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Copies of (rgb, present, tile_checksums) that agree with each other"""
+        with self._write_lock:
+            return self.rgb.copy(), self.present.copy(), self.tile_checksums.copy()
+
+    def _recompute_checksums(self):
+        """Rebuild every tile checksum from the pixel data"""
+        ys, xs = np.indices((self.height, self.width))
+        digests = np.where(self.present, pixel_digests(xs, ys, self.rgb), np.uint64(0))
+
+        # Pad to whole tiles, then sum each tile block (uint64 sums wrap mod 2^64)
+        padded = np.zeros((self.tiles_y * self.tile_size, self.tiles_x * self.tile_size), dtype=np.uint64)
+        padded[:self.height, :self.width] = digests
+        blocks = padded.reshape(self.tiles_y, self.tile_size, self.tiles_x, self.tile_size)
+        self.tile_checksums[...] = blocks.sum(axis=(1, 3), dtype=np.uint64)
+
+    def _checksum_with_pixel(self, x: int, y: int, r: int, g: int, b: int) -> int:
+        """Get the checksum the pixel's tile would have after writing it"""
+        checksum = int(self.tile_checksums[y // self.tile_size, x // self.tile_size])
+        if self.present[y, x]:
+            old_r, old_g, old_b = self.rgb[y, x].tolist()
+            checksum -= pixel_digest(x, y, old_r, old_g, old_b)
+        return (checksum + pixel_digest(x, y, r, g, b)) & MASK64
+
+    def checksum_after_write(self, x: int, y: int, r: int, g: int, b: int) -> str:
+        """Get the tile checksum that a pending pixel write will produce"""
+        return format_checksum(self._checksum_with_pixel(x, y, r, g, b))
+
+    def set_pixel(self, x: int, y: int, r: int, g: int, b: int) -> bool:
+        """Apply a committed pixel write to the buffer; True if the pixel was unset"""
+        with self._write_lock:
+            checksum = self._checksum_with_pixel(x, y, r, g, b)
+            self.tile_checksums[y // self.tile_size, x // self.tile_size] = checksum
+            was_set = bool(self.present[y, x])
+            self.rgb[y, x] = (r, g, b)
+            self.present[y, x] = True
+        return not was_set
+
+    def _tile_indices(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        return (ys // self.tile_size) * self.tiles_x + xs // self.tile_size
+
+    def _checksums_with_pixels(self, xs: np.ndarray, ys: np.ndarray, rgb: np.ndarray) -> np.ndarray:
+        """Get all tile checksums as they would be after writing distinct pixels"""
+        old = np.where(self.present[ys, xs], pixel_digests(xs, ys, self.rgb[ys, xs]), np.uint64(0))
+        with np.errstate(over="ignore"):
+            deltas = pixel_digests(xs, ys, rgb) - old
+        checksums = self.tile_checksums.ravel().copy()
+        np.add.at(checksums, self._tile_indices(xs, ys), deltas)
+        return checksums.reshape(self.tile_checksums.shape)
+
+    def _checksums_without_pixels(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Get all tile checksums as they would be after unsetting distinct pixels"""
+        old = np.where(self.present[ys, xs], pixel_digests(xs, ys, self.rgb[ys, xs]), np.uint64(0))
+        with np.errstate(over="ignore"):
+            deltas = np.uint64(0) - old
+        checksums = self.tile_checksums.ravel().copy()
+        np.add.at(checksums, self._tile_indices(xs, ys), deltas)
+        return checksums.reshape(self.tile_checksums.shape)
+
+    def _touched_checksums(self, checksums: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> Dict[Tuple[int, int], str]:
+        tiles = np.unique(self._tile_indices(xs, ys))
+        return {
+            (int(tile % self.tiles_x), int(tile // self.tiles_x)): format_checksum(int(checksums.flat[tile]))
+            for tile in tiles
+        }
+
+    def checksums_after_writes(self, xs: np.ndarray, ys: np.ndarray, rgb: np.ndarray) -> Dict[Tuple[int, int], str]:
+        """Get the checksums of the tiles a pending batch of distinct pixel writes touches"""
+        return self._touched_checksums(self._checksums_with_pixels(xs, ys, rgb), xs, ys)
+
+    def tile_checksums_at(self, xs: np.ndarray, ys: np.ndarray) -> Dict[Tuple[int, int], str]:
+        """Get the current checksums of the tiles containing the given pixels"""
+        return self._touched_checksums(self.tile_checksums, xs, ys)
+
+    def set_pixels(self, xs: np.ndarray, ys: np.ndarray, rgb: np.ndarray) -> int:
+        """Apply a committed batch of distinct pixel writes; returns how many were unset"""
+        with self._write_lock:
+            self.tile_checksums[...] = self._checksums_with_pixels(xs, ys, rgb)
+            new_pixels = int(np.count_nonzero(~self.present[ys, xs]))
+            self.rgb[ys, xs] = rgb
+            self.present[ys, xs] = True
+        return new_pixels
+
+    def clear_pixels(self, xs: np.ndarray, ys: np.ndarray) -> int:
+        """Apply a committed batch of distinct pixel deletions; returns how many were set"""
+        with self._write_lock:
+            self.tile_checksums[...] = self._checksums_without_pixels(xs, ys)
+            removed = int(np.count_nonzero(self.present[ys, xs]))
+            self.rgb[ys, xs] = 0
+            self.present[ys, xs] = False
+        return removed
+
+    def clear(self):
+        """Drop every pixel from the buffer"""
+        with self._write_lock:
+            self.rgb.fill(0)
+            self.present.fill(False)
+            self.tile_checksums.fill(0)
+
+    def get_tile_checksum(self, tile_x: int, tile_y: int) -> str:
+        """Get the current checksum of a tile"""
+        if not self.has_tile(tile_x, tile_y):
+            return format_checksum(0)
+        return format_checksum(int(self.tile_checksums[tile_y, tile_x]))
+
+    def get_tile(self, tile_x: int, tile_y: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Get (rgb, present) views of a tile"""
+        x_start, y_start, x_end, y_end = self.tile_bounds(tile_x, tile_y)
+        return (
+            self.rgb[y_start:y_end, x_start:x_end],
+            self.present[y_start:y_end, x_start:x_end]
+        )
+
+    def encode_tile(self, tile_x: int, tile_y: int) -> bytes:
+        """Encode a tile in the binary wire format"""
+        rgb, present = self.get_tile(tile_x, tile_y)
+        return encode_tile(tile_x, tile_y, rgb, present)
+
+    def get_tile_pixels(self, tile_x: int, tile_y: int) -> List[Tuple[int, int, int, int, int]]:
+        """Get all set pixels in a tile as (x, y, r, g, b) tuples"""
+        if not self.has_tile(tile_x, tile_y):
+            return []
+
+        x_start, y_start, _, _ = self.tile_bounds(tile_x, tile_y)
+        rgb, present = self.get_tile(tile_x, tile_y)
+        ys, xs = np.nonzero(present)
+        colors = rgb[ys, xs]
+
+        return list(zip(
+            (xs + x_start).tolist(),
+            (ys + y_start).tolist(),
+            colors[:, 0].tolist(),
+            colors[:, 1].tolist(),
+            colors[:, 2].tolist()
+        ))
+
+canvas_buffer = CanvasBuffer(settings.canvas_width, settings.canvas_height, settings.tile_size)
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from database import PlacementLog, async_session
+from canvas_buffer import canvas_buffer
+from placement_history import placement_history, latest_placements, REPLAY_BATCH_SIZE
+from shared_canvas import is_maintenance_leader
+from config import settings
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# File layout: this header, then row-major RGB bytes, the presence mask (one
+# byte per pixel) and the uint64 tile checksums, each at a 64-byte boundary
+CHECKPOINT_MAGIC = b"PIXCKPT1"
+CHECKPOINT_HEADER = struct.Struct("<8sIIIqq")  # magic, width, height, tile_size, taken_at, replay_from
+
+def _align(offset: int) -> int:
+    return (offset + 63) & ~63
+
+def checkpoint_layout(width: int, height: int, tile_size: int) -> Tuple[int, int, int, int]:
+    """Offsets of the RGB, presence and checksum arrays, and the total file size"""
+    tiles = ((width + tile_size - 1) // tile_size) * ((height + tile_size - 1) // tile_size)
+    rgb_offset = _align(CHECKPOINT_HEADER.size)
+    present_offset = _align(rgb_offset + width * height * 3)
+    checksums_offset = _align(present_offset + width * height)
+    return rgb_offset, present_offset, checksums_offset, checksums_offset + tiles * 8
+
+def write_checkpoint(path: str, rgb: np.ndarray, present: np.ndarray, tile_checksums: np.ndarray, taken_at: int, replay_from: int):
+    """Atomically replace the checkpoint file: write a temporary file, fsync, rename"""
+    height, width = present.shape
+    rgb_offset, present_offset, checksums_offset, size = checkpoint_layout(width, height, canvas_buffer.tile_size)
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, width, height, canvas_buffer.tile_size, taken_at, replay_from))
+        for offset, array in ((rgb_offset, rgb), (present_offset, present), (checksums_offset, tile_checksums)):
+            f.seek(offset)
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(size)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+class CanvasCheckpoint:
+    """Periodic on-disk checkpoint of the canvas buffer for fast restarts.
+
+    Loading the buffer from the pixels table takes time proportional to the
+    number of pixels set. Instead, startup maps the latest checkpoint (canvas,
+    tile checksums and the time it was taken) and replays only the placement
+    log written since, so restart time depends on the checkpoint interval, not
+    on how full the canvas is.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._task: Optional[asyncio.Task] = None
+
+    async def save(self) -> bool:
+        """Write a checkpoint of the current canvas buffer"""
+        if not canvas_buffer.loaded or not self.path:
+            return False
+
+        # Placements committed after this moment are replayed from the log on restore
+        taken_at = int(time.time())
+        async with async_session() as db:
+            replay_from = await placement_history.replay_start(db, taken_at)
+        # Under the write lock, so the checksums match the pixels even while other workers write
+        rgb, present, tile_checksums = canvas_buffer.snapshot()
+        await asyncio.get_running_loop().run_in_executor(
+            None, write_checkpoint, self.path, rgb, present, tile_checksums, taken_at, replay_from
+        )
+        logger.info(f"Canvas checkpoint written to {self.path}")
+        return True
+
+    def _read_header(self) -> Optional[Tuple[int, int]]:
+        """Check the checkpoint file matches this canvas; returns (taken_at, replay_from)"""
+        with open(self.path, "rb") as f:
+            header = f.read(CHECKPOINT_HEADER.size)
+            size = os.fstat(f.fileno()).st_size
+        magic, width, height, tile_size, taken_at, replay_from = CHECKPOINT_HEADER.unpack(header)
+        geometry = (canvas_buffer.width, canvas_buffer.height, canvas_buffer.tile_size)
+        if magic != CHECKPOINT_MAGIC or (width, height, tile_size) != geometry:
+            logger.warning(f"Ignoring canvas checkpoint {self.path}: different format or canvas size")
+            return None
+        if size != checkpoint_layout(width, height, tile_size)[3]:
+            logger.warning(f"Ignoring truncated canvas checkpoint {self.path}")
+            return None
+        return taken_at, replay_from
+
+    def _read(self):
+        """Map the checkpoint file into the canvas buffer"""
+        width, height, tile_size = canvas_buffer.width, canvas_buffer.height, canvas_buffer.tile_size
+        rgb_offset, present_offset, checksums_offset, _ = checkpoint_layout(width, height, tile_size)
+        with open(self.path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                canvas_buffer.restore(
+                    np.frombuffer(data, dtype=np.uint8, count=height * width * 3, offset=rgb_offset).reshape(height, width, 3),
+                    np.frombuffer(data, dtype=bool, count=height * width, offset=present_offset).reshape(height, width),
+                    np.frombuffer(data, dtype=np.uint64, count=canvas_buffer.tile_checksums.size, offset=checksums_offset)
+                    .reshape(canvas_buffer.tile_checksums.shape)
+                )
+
+    async def restore(self, db: AsyncSession, progress: Optional[Callable[[int], None]] = None) -> bool:
+        """Load the canvas buffer from the checkpoint plus the log since; False if that isn't possible.
+
+        progress is called with the number of placements replayed so far.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return False
+
+        start_time = time.time()
+        loop = asyncio.get_running_loop()
+        try:
+            header = await loop.run_in_executor(None, self._read_header)
+        except (OSError, struct.error) as e:
+            logger.warning(f"Could not read canvas checkpoint {self.path}: {e}")
+            return False
+        if header is None:
+            return False
+        taken_at, replay_from = header
+
+        # The log can't reproduce a bulk rewrite, nor placements whose partitions were dropped
+        reset_at = await placement_history.last_reset_time(db)
+        if reset_at is not None and reset_at >= taken_at:
+            logger.info("Canvas was reset after the checkpoint was taken, loading it from the database")
+            return False
+        if settings.history_retention_days > 0 and time.time() - replay_from > (settings.history_retention_days - 1) * 86400:
+            logger.info("Canvas checkpoint is older than the retained placement log, loading from the database")
+            return False
+
+        # Only now touch the buffer; until the replay is done it holds a stale canvas
+        try:
+            await loop.run_in_executor(None, self._read)
+            replayed = 0
+            result = await db.stream(
+                select(PlacementLog.x, PlacementLog.y, PlacementLog.r, PlacementLog.g, PlacementLog.b)
+                .where(PlacementLog.placed_at >= replay_from)
+                .order_by(PlacementLog.placed_at, PlacementLog.id)
+            )
+            async for rows in result.partitions(REPLAY_BATCH_SIZE):
+                data = latest_placements(rows, canvas_buffer.width, canvas_buffer.height)
+                canvas_buffer.set_pixels(data[:, 0], data[:, 1], data[:, 2:5].astype(np.uint8))
+                replayed += len(rows)
+                if progress is not None:
+                    progress(replayed)
+        except Exception as e:
+            canvas_buffer.loaded = False
+            logger.warning(f"Canvas checkpoint restore failed, loading from the database: {e}")
+            await db.rollback()
+            return False
+
+        logger.info(
+            f"Canvas restored from checkpoint taken {int(time.time()) - taken_at}s ago, "
+            f"replayed {replayed} placements in {time.time() - start_time:.2f}s"
+        )
+        return True
+
+    async def _checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(settings.canvas_checkpoint_interval)
+            try:
+                # With several workers only one of them writes the shared canvas out
+                if is_maintenance_leader():
+                    await self.save()
+            except Exception as e:
+                logger.error(f"Canvas checkpoint failed: {e}")
+
+    def start(self):
+        """Start periodic checkpoints in the background"""
+        if settings.canvas_checkpoint_interval <= 0 or not self.path:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._checkpoint_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+canvas_checkpoint = CanvasCheckpoint(settings.canvas_checkpoint_path)
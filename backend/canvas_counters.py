@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+import numpy as np
+from collections import OrderedDict
+from contextlib import nullcontext
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from database import Pixel, ActiveUser, CanvasCounter, async_session
+from config import settings
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_WINDOW_SECONDS = 3600  # Users who placed a pixel in the last hour count as active
+
+class CanvasCounters:
+    """Global canvas counters kept current by the write paths.
+
+    The totals are adjusted in memory as placements commit, so reading them
+    costs nothing. A background task periodically recounts the real tables,
+    corrects any drift and stores the result in canvas_counters, which seeds
+    the counters on the next startup. In multi-worker mode the pixel total is
+    kept in memory shared by the workers; activity is tracked per worker.
+    """
+
+    def __init__(self):
+        self._totals = np.zeros(1, dtype=np.int64)
+        self._write_lock = nullcontext()
+        self._last_seen: "OrderedDict[str, int]" = OrderedDict()  # identity -> last placement, oldest first
+        self._task: Optional[asyncio.Task] = None
+
+    def attach(self, totals: np.ndarray, write_lock):
+        """Keep the pixel total in memory that other worker processes share"""
+        self._totals = totals
+        self._write_lock = write_lock
+
+    @property
+    def total_pixels(self) -> int:
+        return int(self._totals[0])
+
+    @total_pixels.setter
+    def total_pixels(self, value: int):
+        self._totals[0] = value
+
+    def add_pixels(self, count: int):
+        """Record pixels that were set for the first time"""
+        if count:
+            with self._write_lock:
+                self._totals[0] += count
+
+    def touch(self, identity: str, timestamp: int):
+        """Record a placement by a user or IP"""
+        self._last_seen[identity] = timestamp
+        self._last_seen.move_to_end(identity)
+
+    def active_users(self, now: Optional[int] = None) -> int:
+        """Number of users or IPs that placed a pixel within the active window"""
+        cutoff = (now or int(time.time())) - ACTIVE_WINDOW_SECONDS
+        while self._last_seen:
+            identity, last_seen = next(iter(self._last_seen.items()))
+            if last_seen > cutoff:
+                break
+            del self._last_seen[identity]
+        return len(self._last_seen)
+
+    async def load(self, db: AsyncSession):
+        """Seed the counters from their last stored values and recent activity"""
+        result = await db.execute(select(CanvasCounter.value).where(CanvasCounter.name == "total_pixels"))
+        stored = result.scalar()
+        if stored is None:
+            # Nothing stored yet (first start on this database): count once now
+            await self.reconcile(db)
+            return
+        self.total_pixels = stored
+        await self._load_active(db, int(time.time()))
+
+    async def load_activity(self, db: AsyncSession):
+        """Seed only the activity window, e.g. when the shared total is already loaded"""
+        await self._load_active(db, int(time.time()))
+
+    async def _load_active(self, db: AsyncSession, now: int):
+        """Rebuild the activity window from active_users, keeping newer placements"""
+        result = await db.execute(
+            select(ActiveUser.user_id, ActiveUser.ip_address, ActiveUser.last_seen)
+            .where(ActiveUser.last_seen > now - ACTIVE_WINDOW_SECONDS)
+        )
+        last_seen = {
+            f"user:{user_id}" if user_id else f"ip:{ip_address}": seen
+            for user_id, ip_address, seen in result.all()
+        }
+        for identity, seen in self._last_seen.items():
+            last_seen[identity] = max(seen, last_seen.get(identity, 0))
+        self._last_seen = OrderedDict(sorted(last_seen.items(), key=lambda item: item[1]))
+
+    async def reconcile(self, db: AsyncSession):
+        """Recount the real tables, correct drift and store the counters"""
+        start_time = time.time()
+        base_pixels = self.total_pixels
+        result = await db.execute(select(func.count()).select_from(Pixel))
+        counted_pixels = result.scalar() or 0
+        # Keep placements that committed while the count was running; the
+        # correction is applied under the write lock other workers add under
+        with self._write_lock:
+            self._totals[0] += counted_pixels - base_pixels
+
+        now = int(time.time())
+        await self._load_active(db, now)
+
+        values = {"total_pixels": self.total_pixels, "active_users": self.active_users(now)}
+        statement = insert(CanvasCounter).values([
+            {"name": name, "value": value, "updated_at": now} for name, value in values.items()
+        ])
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[CanvasCounter.name],
+            set_={"value": statement.excluded.value, "updated_at": statement.excluded.updated_at}
+        ))
+        await db.commit()
+        logger.debug(f"Canvas counters reconciled in {time.time() - start_time:.2f}s: {values}")
+
+    async def _reconcile_loop(self):
+        # Imported here: shared_canvas attaches these counters, so it imports this module
+        from shared_canvas import is_maintenance_leader
+        while True:
+            await asyncio.sleep(settings.stats_reconcile_interval)
+            try:
+                async with async_session() as db:
+                    # With several workers only one of them recounts the shared total
+                    if is_maintenance_leader():
+                        await self.reconcile(db)
+                    else:
+                        await self.load_activity(db)
+            except Exception as e:
+                logger.error(f"Canvas counter reconciliation failed: {e}")
+
+    def start(self):
+        """Start periodic reconciliation in the background"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._reconcile_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+canvas_counters = CanvasCounters()
@@ -0,0 +1,66 @@
+import asyncio
+import hashlib
+import io
+import logging
+import numpy as np
+from PIL import Image
+from canvas_buffer import canvas_buffer
+from change_log import change_log
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+EXPORT_MEDIA_TYPES = {
+    "png": "image/png",
+    "raw": "application/octet-stream",
+}
+
+def encode_canvas(format: str, rgb: np.ndarray, present: np.ndarray) -> Tuple[bytes, str]:
+    """Encode a canvas snapshot, returning (data, etag)"""
+    if format == "png":
+        # Unset pixels are transparent
+        alpha = present.astype(np.uint8) * 255
+        image = Image.fromarray(np.dstack((rgb, alpha)), mode="RGBA")
+        output = io.BytesIO()
+        image.save(output, format="PNG", compress_level=6)
+        data = output.getvalue()
+    else:
+        data = np.ascontiguousarray(rgb, dtype=np.uint8).tobytes()
+
+    return data, f'"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+
+class CanvasExporter:
+    """Full-canvas PNG and raw RGB exports, cached by canvas version.
+
+    The change log cursor advances on every committed write, so it serves as
+    the canvas version: exports are rendered at most once per version and
+    format, concurrent requests share one render, and encoding runs in a
+    worker thread so it never blocks the event loop.
+    """
+
+    def __init__(self):
+        # format -> (version, task resolving to (data, etag))
+        self._renders: Dict[str, Tuple[int, asyncio.Future]] = {}
+
+    async def export(self, format: str) -> Tuple[bytes, str, int]:
+        """Get (data, etag, version) of the current canvas in a format"""
+        version = change_log.cursor
+        cached = self._renders.get(format)
+        if cached is None or cached[0] != version:
+            # Snapshot synchronously so the render matches the version, and under
+            # the write lock so another worker's write can't tear it
+            rgb, present, _ = canvas_buffer.snapshot()
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(None, encode_canvas, format, rgb, present)
+            cached = (version, future)
+            self._renders[format] = cached
+
+        try:
+            data, etag = await asyncio.shield(cached[1])
+        except Exception:
+            if self._renders.get(format) is cached:
+                del self._renders[format]
+            raise
+        return data, etag, cached[0]
+
+canvas_exporter = CanvasExporter()
@@ -0,0 +1,316 @@
+import asyncio
+import logging
+import secrets
+import time
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from database import async_session
+from canvas_buffer import canvas_buffer
+from canvas_counters import canvas_counters
+from change_log import change_log
+from placement_history import placement_history
+from services import UPSERT_PIXELS_SQL, UPSERT_TILE_UPDATES_SQL
+from config import settings
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Row bands of the region are cleared one statement at a time; RETURNING tells
+# the buffer exactly which pixels went, including any placed meanwhile
+CLEAR_REGION_SQL = text("""
+    DELETE FROM pixels
+    WHERE x >= :x_start AND x < :x_end AND y >= :y_start AND y < :y_end
+    RETURNING x, y
+""")
+
+# Index of each pixel's color in a pattern fill
+PATTERNS = {
+    "checkerboard": lambda xs, ys, cell: xs // cell + ys // cell,
+    "rows": lambda xs, ys, cell: ys // cell,
+    "columns": lambda xs, ys, cell: xs // cell
+}
+
+Region = Tuple[int, int, int, int]  # x_start, y_start, x_end, y_end
+
+def parse_color(color: str) -> Tuple[int, int, int]:
+    """Parse #rrggbb (or rrggbb) into an (r, g, b) tuple"""
+    value = int(color.lstrip("#"), 16)
+    return (value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF
+
+def region_bands(region: Region, chunk_pixels: int) -> List[Region]:
+    """Split a region into bands of whole rows holding at most chunk_pixels each"""
+    x_start, y_start, x_end, y_end = region
+    rows = max(1, chunk_pixels // (x_end - x_start))
+    return [(x_start, y, x_end, min(y + rows, y_end)) for y in range(y_start, y_end, rows)]
+
+def band_coordinates(band: Region) -> Tuple[np.ndarray, np.ndarray]:
+    """Every (x, y) in a band, row-major"""
+    x_start, y_start, x_end, y_end = band
+    ys, xs = np.mgrid[y_start:y_end, x_start:x_end]
+    return xs.ravel(), ys.ravel()
+
+class CanvasJob:
+    """One admin bulk operation and its progress"""
+
+    def __init__(self, operation: str, params: Dict, total: int):
+        self.id = secrets.token_hex(8)
+        self.operation = operation
+        self.params = params
+        self.status = "running"
+        self.total = total  # Pixels the job visits
+        self.processed = 0
+        self.written = 0
+        self.cleared = 0
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "operation": self.operation,
+            "params": self.params,
+            "status": self.status,
+            "progress": round(self.processed / self.total, 4) if self.total else 1.0,
+            "processed": self.processed,
+            "total": self.total,
+            "written": self.written,
+            "cleared": self.cleared,
+            "error": self.error,
+            "started_at": int(self.started_at),
+            "finished_at": int(self.finished_at) if self.finished_at else None
+        }
+
+class CanvasJobs:
+    """Admin bulk canvas operations (fill, pattern, clear, scramble) run as background jobs.
+
+    Pixel data is generated with NumPy and written in chunks of CHUNK_PIXELS,
+    each one set-based statement in its own short transaction, so live
+    placements keep committing between chunks instead of waiting behind one
+    canvas-wide transaction. Written pixels go through the placement log like
+    any other write; cleared ones end with a reset keyframe, since the log
+    can't express deletions. One job runs at a time per process.
+    """
+
+    CHUNK_PIXELS = 16384
+    CHUNK_ATTEMPTS = 3
+    MAX_FINISHED = 20
+
+    def __init__(self):
+        self.jobs: Dict[str, CanvasJob] = {}
+
+    def running(self) -> Optional[CanvasJob]:
+        for job in self.jobs.values():
+            if job.status == "running":
+                return job
+        return None
+
+    def get(self, job_id: str) -> Optional[CanvasJob]:
+        return self.jobs.get(job_id)
+
+    def recent(self) -> List[CanvasJob]:
+        """Running and recently finished jobs, newest first"""
+        return list(reversed(self.jobs.values()))
+
+    @staticmethod
+    def resolve_region(x: int, y: int, width: Optional[int], height: Optional[int]) -> Tuple[Optional[Region], Optional[str]]:
+        """Check a region lies on the canvas; width and height default to the rest of it"""
+        x_end = settings.canvas_width if width is None else x + width
+        y_end = settings.canvas_height if height is None else y + height
+        if not (0 <= x < x_end <= settings.canvas_width and 0 <= y < y_end <= settings.canvas_height):
+            return None, "Region out of bounds"
+        return (x, y, x_end, y_end), None
+
+    def fill(self, region: Region, color: str) -> Tuple[Optional[CanvasJob], Optional[str]]:
+        """Set every pixel of a region to one color"""
+        rgb = np.array(parse_color(color), dtype=np.uint8)
+
+        def chunks():
+            for band in region_bands(region, self.CHUNK_PIXELS):
+                xs, ys = band_coordinates(band)
+                yield xs, ys, np.broadcast_to(rgb, (len(xs), 3))
+
+        return self._start("fill", {"region": region, "color": color}, region, chunks())
+
+    def pattern(self, region: Region, pattern: str, colors: List[str], cell_size: int) -> Tuple[Optional[CanvasJob], Optional[str]]:
+        """Fill a region with a repeating pattern cycling through colors"""
+        if pattern not in PATTERNS:
+            return None, f"Unknown pattern {pattern}"
+        palette = np.array([parse_color(color) for color in colors], dtype=np.uint8)
+        # Cells are counted from the canvas origin so adjacent fills line up
+        index = PATTERNS[pattern]
+
+        def chunks():
+            for band in region_bands(region, self.CHUNK_PIXELS):
+                xs, ys = band_coordinates(band)
+                yield xs, ys, palette[index(xs, ys, cell_size) % len(palette)]
+
+        params = {"region": region, "pattern": pattern, "colors": colors, "cell_size": cell_size}
+        return self._start("pattern", params, region, chunks())
+
+    def clear(self, region: Region) -> Tuple[Optional[CanvasJob], Optional[str]]:
+        """Unset every pixel of a region"""
+        return self._start("clear", {"region": region}, region, None, clear_first=True)
+
+    def scramble(self, region: Region, pixels: int, clear_first: bool, seed: Optional[int]) -> Tuple[Optional[CanvasJob], Optional[str]]:
+        """Set pixels at distinct random positions of a region to random colors"""
+        x_start, y_start, x_end, y_end = region
+        area = (x_end - x_start) * (y_end - y_start)
+        if pixels > area:
+            return None, f"A region of {area} pixels can't hold {pixels} distinct pixels"
+        rng = np.random.default_rng(seed)
+
+        def chunks():
+            # Row-major order, like the other writers, so concurrent upserts lock rows in one order
+            positions = np.sort(rng.choice(area, size=pixels, replace=False))
+            for start in range(0, pixels, self.CHUNK_PIXELS):
+                offsets = positions[start:start + self.CHUNK_PIXELS]
+                xs = x_start + offsets % (x_end - x_start)
+                ys = y_start + offsets // (x_end - x_start)
+                yield xs, ys, rng.integers(0, 256, size=(len(offsets), 3), dtype=np.uint8)
+
+        params = {"region": region, "pixels": pixels, "clear": clear_first, "seed": seed}
+        return self._start("scramble", params, region, chunks(), clear_first=clear_first, total=pixels)
+
+    def _start(self, operation: str, params: Dict, region: Region, chunks: Optional[Iterator], clear_first: bool = False,
+               total: Optional[int] = None) -> Tuple[Optional[CanvasJob], Optional[str]]:
+        if self.running() is not None:
+            return None, "Another canvas job is running"
+        if not canvas_buffer.loaded:
+            return None, "Canvas buffer not loaded"
+
+        x_start, y_start, x_end, y_end = region
+        area = (x_end - x_start) * (y_end - y_start)
+        written = 0 if chunks is None else area if total is None else total
+        job = CanvasJob(operation, params, (area if clear_first else 0) + written)
+        self.jobs[job.id] = job
+        # Forget the oldest finished jobs
+        finished = [job_id for job_id, other in self.jobs.items() if other.status != "running"]
+        for job_id in finished[:max(0, len(finished) - self.MAX_FINISHED)]:
+            del self.jobs[job_id]
+
+        job.task = asyncio.create_task(self._run(job, region, chunks, clear_first))
+        logger.info(f"Canvas job {job.id} started: {operation} {params}")
+        return job, None
+
+    async def _run(self, job: CanvasJob, region: Region, chunks: Optional[Iterator], clear_first: bool):
+        status = "failed"
+        try:
+            if clear_first:
+                for band in region_bands(region, self.CHUNK_PIXELS):
+                    await self._clear_band(job, band)
+            for xs, ys, rgb in chunks or ():
+                await self._write_chunk(job, xs, ys, rgb)
+            status = "completed"
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Canvas job {job.id} failed: {e}")
+            job.error = str(e)
+        finally:
+            # Also after a failure: whatever was cleared before it is gone for good
+            await self._finish(job, status)
+
+    async def _finish(self, job: CanvasJob, status: str):
+        if job.cleared:
+            # The change log only carries set pixels, so clients resync the changed
+            # tiles by checksum; once per job, not once per cleared band
+            change_log.invalidate()
+        try:
+            async with async_session() as db:
+                if job.cleared:
+                    # Deletions aren't in the placement log, so replays must start after them
+                    await placement_history.capture_keyframe(db, reset=True)
+                await canvas_counters.reconcile(db)
+        except Exception as e:
+            logger.error(f"Canvas job {job.id} cleanup failed: {e}")
+        # The job only stops counting as running once the cleanup is done
+        job.finished_at = time.time()
+        job.status = status
+        logger.info(f"Canvas job {job.id} {job.status} in {job.finished_at - job.started_at:.2f}s")
+
+    async def _with_retries(self, write):
+        """Run a chunk write, retrying when it loses a deadlock against live placements"""
+        for attempt in range(self.CHUNK_ATTEMPTS):
+            try:
+                return await write()
+            except DBAPIError as e:
+                if attempt == self.CHUNK_ATTEMPTS - 1 or "deadlock" not in str(e).lower():
+                    raise
+                await asyncio.sleep(0.05 * (attempt + 1))
+
+    async def _clear_band(self, job: CanvasJob, band: Region):
+        x_start, y_start, x_end, y_end = band
+
+        async def delete():
+            async with async_session() as db:
+                result = await db.execute(CLEAR_REGION_SQL, {"x_start": x_start, "y_start": y_start, "x_end": x_end, "y_end": y_end})
+                rows = np.array(result.all(), dtype=np.int64).reshape(-1, 2)
+                await db.commit()
+            return rows
+
+        rows = await self._with_retries(delete)
+        if len(rows):
+            xs, ys = rows[:, 0], rows[:, 1]
+            canvas_counters.add_pixels(-canvas_buffer.clear_pixels(xs, ys))
+            await self._store_tile_checksums(xs, ys)
+        job.processed += (x_end - x_start) * (y_end - y_start)
+        job.cleared += len(rows)
+
+    async def _write_chunk(self, job: CanvasJob, xs: np.ndarray, ys: np.ndarray, rgb: np.ndarray):
+        async def upsert():
+            async with async_session() as db:
+                await db.execute(UPSERT_PIXELS_SQL, {
+                    "ip_address": None,
+                    "timestamp": int(time.time()),
+                    "tile_size": settings.tile_size,
+                    "xs": xs.tolist(),
+                    "ys": ys.tolist(),
+                    "rs": rgb[:, 0].tolist(),
+                    "gs": rgb[:, 1].tolist(),
+                    "bs": rgb[:, 2].tolist()
+                })
+                await db.commit()
+
+        await self._with_retries(upsert)
+        canvas_counters.add_pixels(canvas_buffer.set_pixels(xs, ys, rgb))
+        change_log.extend(np.column_stack((xs, ys, rgb)).tolist())
+        await self._store_tile_checksums(xs, ys)
+        job.processed += len(xs)
+        job.written += len(xs)
+
+    async def _store_tile_checksums(self, xs: np.ndarray, ys: np.ndarray):
+        """Store the buffer's checksums of the tiles a chunk touched.
+
+        This is a transaction of its own: live placements lock their pixel and
+        tile rows in either order, so holding pixel rows while waiting for tile
+        rows could deadlock against them.
+        """
+        tile_checksums = canvas_buffer.tile_checksums_at(xs, ys)
+
+        async def upsert():
+            async with async_session() as db:
+                await db.execute(UPSERT_TILE_UPDATES_SQL, {
+                    "timestamp": int(time.time()),
+                    "tile_xs": [tile_x for tile_x, _ in tile_checksums],
+                    "tile_ys": [tile_y for _, tile_y in tile_checksums],
+                    "checksums": list(tile_checksums.values())
+                })
+                await db.commit()
+
+        await self._with_retries(upsert)
+
+    async def stop(self):
+        """Cancel a running job; chunks already committed stay"""
+        job = self.running()
+        if job is not None and job.task is not None:
+            job.task.cancel()
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                pass
+
+canvas_jobs = CanvasJobs()
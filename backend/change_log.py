@@ -0,0 +1,131 @@
+import asyncio
+import numpy as np
+from contextlib import nullcontext
+from config import settings
+from typing import List, Optional, Tuple
+
+# One change: sequence number, then the pixel written
+CHANGE_DTYPE = np.dtype([("seq", "<u8"), ("x", "<u2"), ("y", "<u2"), ("r", "u1"), ("g", "u1"), ("b", "u1")], align=True)
+
+# Slots of the state array
+CURSOR, FLOOR = 0, 1
+
+class ChangeLog:
+    """Bounded in-memory log of committed pixel changes.
+
+    Every change gets a monotonic sequence number; clients poll with the last
+    sequence they applied (their cursor) and receive exactly what changed since.
+    Cursors older than the retained window have aged out and must resync.
+
+    Changes live in a ring buffer indexed by sequence number, so in multi-worker
+    mode the ring and its state can be mapped into memory shared by every worker.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries = np.zeros(capacity, dtype=CHANGE_DTYPE)
+        self.state = np.zeros(2, dtype=np.uint64)  # cursor, floor (cursors below it can't be served)
+        self.shared = False
+        self._write_lock = nullcontext()
+        self._event: Optional[asyncio.Event] = None
+
+    def attach(self, entries: np.ndarray, state: np.ndarray, write_lock):
+        """Use a ring and state that other worker processes share"""
+        self.capacity = len(entries)
+        self.entries = entries
+        self.state = state
+        self.shared = True
+        self._write_lock = write_lock
+
+    @property
+    def cursor(self) -> int:
+        """Sequence number of the latest change"""
+        return int(self.state[CURSOR])
+
+    def append(self, x: int, y: int, r: int, g: int, b: int) -> int:
+        """Record a committed pixel change and wake any waiting long-polls"""
+        with self._write_lock:
+            cursor = int(self.state[CURSOR]) + 1
+            self.entries[cursor % self.capacity] = (cursor, x, y, r, g, b)
+            # Publish the cursor only once its entry is written
+            self.state[CURSOR] = cursor
+        self._notify()
+        return cursor
+
+    def extend(self, pixels: List[Tuple[int, int, int, int, int]]) -> int:
+        """Record a committed batch of (x, y, r, g, b) changes"""
+        if not pixels:
+            return self.cursor
+        data = np.array(pixels, dtype=np.int64).reshape(-1, 5)[-self.capacity:]
+        with self._write_lock:
+            first = int(self.state[CURSOR]) + 1
+            # Only the newest capacity changes fit; older ones in the batch age out at once
+            skipped = len(pixels) - len(data)
+            seqs = np.arange(first + skipped, first + len(pixels), dtype=np.uint64)
+            slots = seqs % np.uint64(self.capacity)
+            self.entries["seq"][slots] = seqs
+            for index, field in enumerate(("x", "y", "r", "g", "b")):
+                self.entries[field][slots] = data[:, index]
+            self.state[CURSOR] = first + len(pixels) - 1
+        self._notify()
+        return self.cursor
+
+    def invalidate(self):
+        """Force every client to resync, e.g. after a bulk canvas rewrite"""
+        with self._write_lock:
+            cursor = int(self.state[CURSOR]) + 1
+            self.state[FLOOR] = cursor
+            self.state[CURSOR] = cursor
+        self._notify()
+
+    def oldest_servable(self) -> int:
+        """Lowest cursor that can still be answered incrementally"""
+        return max(self.cursor - self.capacity, int(self.state[FLOOR]))
+
+    def since(self, cursor: Optional[int]) -> Optional[np.ndarray]:
+        """Get changes after a cursor (a CHANGE_DTYPE array), or None if the cursor can't be served"""
+        latest = self.cursor
+        if cursor is None or cursor > latest or cursor < self.oldest_servable():
+            return None
+        if cursor == latest:
+            return self.entries[:0].copy()
+
+        # The requested range wraps around the end of the ring at most once
+        start, end = (cursor + 1) % self.capacity, latest % self.capacity + 1
+        if start < end:
+            changes = self.entries[start:end].copy()
+        else:
+            changes = np.concatenate((self.entries[start:], self.entries[:end]))
+        if not np.array_equal(changes["seq"], np.arange(cursor + 1, latest + 1, dtype=np.uint64)):
+            # Another worker lapped the ring while we were reading
+            return None
+        return changes
+
+    async def wait(self, cursor: Optional[int], timeout: float) -> bool:
+        """Wait until a change newer than the cursor exists or the timeout expires"""
+        if cursor is None or cursor != self.cursor or timeout <= 0:
+            return True
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            if self._event is None:
+                self._event = asyncio.Event()
+            remaining = deadline - loop.time()
+            # Other workers' changes don't set our event, so shared logs are also polled
+            step = min(remaining, settings.shared_poll_interval) if self.shared else remaining
+            try:
+                await asyncio.wait_for(self._event.wait(), step)
+                return True
+            except asyncio.TimeoutError:
+                if cursor != self.cursor:
+                    return True
+                if remaining <= step:
+                    return False
+
+    def _notify(self):
+        if self._event is not None:
+            self._event.set()
+            self._event = None
+
+change_log = ChangeLog(settings.change_log_size)
@@ -0,0 +1,130 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from PIL import Image
+from passlib.context import CryptContext
+from config import settings
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Square sizes generated for every uploaded profile picture; the first is canonical
+PROFILE_PICTURE_SIZES = (200, 64)
+
+# Work functions run in the pool's processes, so they must live at module level
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+def process_profile_picture(file_data: bytes) -> Dict[int, bytes]:
+    """Decode an uploaded image and encode it as a JPEG in every profile picture size"""
+    image = Image.open(io.BytesIO(file_data))
+
+    # Convert to RGB if necessary
+    if image.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
+        image = background
+
+    pictures = {}
+    for size in PROFILE_PICTURE_SIZES:
+        output = io.BytesIO()
+        image.resize((size, size), Image.Resampling.LANCZOS).save(output, format='JPEG', quality=85, optimize=True)
+        pictures[size] = output.getvalue()
+    return pictures
+
+class CpuPoolBusy(Exception):
+    """Raised when too much CPU work is already queued"""
+
+class CpuPool:
+    """Bounded process pool for CPU-bound work (bcrypt, image processing).
+
+    That work holds the GIL, so running it on the event loop, or in threads,
+    stalls every other request on the worker. At most `workers` jobs run at
+    once; up to `max_pending` more wait their turn and anything beyond that is
+    rejected with CpuPoolBusy rather than queueing without bound.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def start(self):
+        """Create the worker processes' executor; done lazily on first use otherwise"""
+        if self._executor is None and self.workers > 0:
+            # Spawned (not forked) workers don't inherit the event loop, sockets or DB pool
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+
+    async def run(self, func: Callable, *args):
+        """Run func(*args) in the pool, waiting for a free slot"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(max(self.workers, 1))
+        if self.queued >= self.max_pending and self._slots.locked():
+            self.rejected += 1
+            raise CpuPoolBusy("Server busy, please try again")
+
+        self.start()
+        queued_at = time.perf_counter()
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+
+        wait = time.perf_counter() - queued_at
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.running += 1
+        try:
+            # Without workers the job runs on a thread; fine for development only
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, float]:
+        started = self.completed + self.failed + self.running
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self.queued,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_ms": self.total_wait / started * 1000 if started else 0.0,
+            "max_wait_ms": self.max_wait * 1000
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+cpu_pool = CpuPool(settings.cpu_pool_workers, settings.cpu_pool_max_pending)
@@ -1,16 +1,58 @@
-from sqlalchemy import create_engine, Column, Integer, SmallInteger, String, DateTime, Index, text, Boolean, LargeBinary, Text
+from sqlalchemy import create_engine, Column, Integer, BigInteger, SmallInteger, String, Date, DateTime, Index, text, Boolean, LargeBinary, Text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, deferred
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy import exc, inspect
 from datetime import datetime
+from typing import Dict
 import asyncio
+import time
 from config import settings
 
+class PoolStats:
+    """Checkout wait times of the async engine's connection pool"""
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+    
+    def record(self, wait: float):
+        self.checkouts += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+pool_stats = PoolStats()
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited"""
+    
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.record(time.perf_counter() - start)
+
 # Create async engine
 engine = create_async_engine(
     settings.database_url.replace("postgresql://", "postgresql+asyncpg://"),
-    echo=False
+    echo=False,
+    poolclass=InstrumentedPool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_pre_ping=settings.db_pool_pre_ping,
+    pool_recycle=settings.db_pool_recycle
 )
 
 # Create sync engine for initial setup
@@ -68,6 +110,49 @@ class TileUpdate(Base):
     tile_x = Column(SmallInteger, primary_key=True)
     tile_y = Column(SmallInteger, primary_key=True)
     last_updated = Column(Integer, nullable=False)
+    checksum = Column(String(16), nullable=True)  # Incremental tile checksum (hex)
+
+class UserDailyStats(Base):
+    __tablename__ = "user_daily_stats"
+    
+    # One row per user, UTC day and color; the primary key serves per-user range reads
+    user_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    color = Column(Integer, primary_key=True)  # Packed as (r << 16) | (g << 8) | b
+    placements = Column(Integer, nullable=False, default=0)
+    last_placed = Column(Integer, nullable=False)
+
+class PlacementLog(Base):
+    __tablename__ = "placement_log"
+    # Range partitioned by day on placed_at; see placement_history.ensure_partitions
+    __table_args__ = {"postgresql_partition_by": "RANGE (placed_at)"}
+    
+    placed_at = Column(Integer, primary_key=True)
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    x = Column(SmallInteger, nullable=False)
+    y = Column(SmallInteger, nullable=False)
+    r = Column(SmallInteger, nullable=False)
+    g = Column(SmallInteger, nullable=False)
+    b = Column(SmallInteger, nullable=False)
+    user_id = Column(Integer, nullable=True)
+    ip_address = Column(String(45), nullable=True)
+
+class CanvasKeyframe(Base):
+    __tablename__ = "canvas_keyframes"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    taken_at = Column(Integer, nullable=False, index=True)
+    replay_from = Column(Integer, nullable=False)  # Log entries from here on are replayed over it
+    width = Column(SmallInteger, nullable=False)
+    height = Column(SmallInteger, nullable=False)
+    data = Column(LargeBinary, nullable=False)  # zlib(RGB bytes + packed presence mask)
+
+class CanvasCounter(Base):
+    __tablename__ = "canvas_counters"
+    
+    name = Column(String(50), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(Integer, nullable=False)
 
 class User(Base):
     __tablename__ = "users"
@@ -83,14 +168,25 @@ class User(Base):
     
     # Profile information
     display_name = Column(String(100), nullable=True)
-    bio = Column(Text, nullable=True)
-    profile_picture = Column(LargeBinary, nullable=True)
+    # Heavy profile columns are only loaded when asked for (undefer or an explicit select)
+    bio = deferred(Column(Text, nullable=True))
+    profile_picture = deferred(Column(LargeBinary, nullable=True))
     profile_picture_type = Column(String(50), nullable=True)  # MIME type
+    profile_picture_hash = Column(String(64), nullable=True)  # Key into profile_pictures
     
     # Statistics
     total_pixels_placed = Column(Integer, default=0)
     registration_ip = Column(String(45), nullable=True)  # VARCHAR for IPv4/IPv6
 
+class ProfilePicture(Base):
+    __tablename__ = "profile_pictures"
+    
+    # Content addressed: hash is the SHA-256 of the canonical (largest) size
+    hash = Column(String(64), primary_key=True)
+    size = Column(SmallInteger, primary_key=True)
+    content_type = Column(String(50), nullable=False)
+    data = Column(LargeBinary, nullable=False)
+
 class EmailVerification(Base):
     __tablename__ = "email_verifications"
     
@@ -109,6 +205,9 @@ Index('idx_user_stats_user', UserStats.user_id)
 Index('idx_user_stats_ip', UserStats.ip_address)
 Index('idx_active_users_user', ActiveUser.user_id)
 Index('idx_active_users_ip', ActiveUser.ip_address)
+# One row per anonymous IP, so placements can upsert with ON CONFLICT
+Index('uq_user_stats_ip', UserStats.ip_address, unique=True, postgresql_where=UserStats.user_id.is_(None))
+Index('uq_active_users_ip', ActiveUser.ip_address, unique=True, postgresql_where=ActiveUser.user_id.is_(None))
 
 async def get_db():
     async with async_session() as session:
@@ -117,7 +216,71 @@ async def get_db():
         finally:
             await session.close()
 
+# Columns added after the initial schema; create_all does not alter existing tables
+SCHEMA_UPGRADES = [
+    "ALTER TABLE tile_updates ADD COLUMN IF NOT EXISTS checksum VARCHAR(16)",
+    # Collapse duplicate anonymous rows left by the old select-then-insert path
+    """DELETE FROM user_stats a USING user_stats b
+       WHERE a.user_id IS NULL AND b.user_id IS NULL AND a.ip_address = b.ip_address AND a.id < b.id""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_user_stats_ip ON user_stats (ip_address) WHERE user_id IS NULL",
+    """DELETE FROM active_users a USING active_users b
+       WHERE a.user_id IS NULL AND b.user_id IS NULL AND a.ip_address = b.ip_address AND a.id < b.id""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_active_users_ip ON active_users (ip_address) WHERE user_id IS NULL",
+    # Seed the daily rollup once from the pixels users still own; history before it is lost
+    """INSERT INTO user_daily_stats (user_id, day, color, placements, last_placed)
+       SELECT user_id, CAST(to_timestamp(last_updated) AT TIME ZONE 'UTC' AS DATE), (r << 16) | (g << 8) | b,
+              COUNT(*), MAX(last_updated)
+       FROM pixels
+       WHERE user_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM user_daily_stats)
+       GROUP BY 1, 2, 3""",
+    # Move legacy inline profile pictures into the content-addressed store
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS profile_picture_hash VARCHAR(64)",
+    """INSERT INTO profile_pictures (hash, size, content_type, data)
+       SELECT encode(sha256(profile_picture), 'hex'), 200, COALESCE(profile_picture_type, 'image/jpeg'), profile_picture
+       FROM users WHERE profile_picture IS NOT NULL
+       ON CONFLICT DO NOTHING""",
+    """UPDATE users SET profile_picture_hash = encode(sha256(profile_picture), 'hex'), profile_picture = NULL
+       WHERE profile_picture IS NOT NULL""",
+    # Catch-all so placements never fail when a day's partition is missing
+    "CREATE TABLE IF NOT EXISTS placement_log_default PARTITION OF placement_log DEFAULT",
+]
+
+async def warm_pool():
+    """Open the pool's base connections up front so first requests don't pay for them"""
+    connections = await asyncio.gather(*(engine.connect().start() for _ in range(settings.db_pool_size)))
+    for connection in connections:
+        await connection.close()
+    # Opening connections isn't queueing; start the wait statistics from here
+    pool_stats.reset()
+
+def get_pool_stats() -> Dict[str, float]:
+    """Live connection pool usage for monitoring"""
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": settings.db_max_overflow,
+        "checkouts": pool_stats.checkouts,
+        "timeouts": pool_stats.timeouts,
+        "avg_wait_ms": pool_stats.total_wait / pool_stats.checkouts * 1000 if pool_stats.checkouts else 0.0,
+        "max_wait_ms": pool_stats.max_wait * 1000
+    }
+
 async def init_db():
     """Initialize the database tables"""
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all) 
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
+        for statement in SCHEMA_UPGRADES:
+            await conn.execute(text(statement))
+
+async def ensure_schema() -> bool:
+    """Run init_db when DB_SYNC_SCHEMA asks for it or a table is missing; returns whether it ran"""
+    if not settings.db_sync_schema:
+        async with engine.connect() as conn:
+            existing = await conn.run_sync(lambda sync_conn: set(inspect(sync_conn).get_table_names()))
+        if set(Base.metadata.tables) <= existing:
+            return False
+    await init_db()
+    return True
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import logging
+import time
+import psutil
+from sqlalchemy import text
+from database import engine
+from config import settings
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class HealthState:
+    """Startup progress and a periodically refreshed view of the process's health.
+
+    Startup moves through phases (schema, pool, canvas, counters) until the
+    worker is ready to serve. Probes read the cached state, so /livez, /readyz
+    and /api/monitor never query the database or the OS themselves; a
+    background loop refreshes the database and memory checks instead.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.phase = "starting"
+        self.phase_started = time.monotonic()
+        self.warmed = False
+        self.stopping = False
+        self.progress: Dict[str, int] = {}
+        self.database_status = "unknown"
+        self.memory_usage: Dict[str, float] = {}
+        self.checked_at = 0.0
+        self.boot_time = psutil.boot_time()
+        self._task: Optional[asyncio.Task] = None
+
+    def begin_phase(self, phase: str):
+        now = time.monotonic()
+        logger.info(f"Startup phase {self.phase} took {now - self.phase_started:.2f}s, starting {phase}")
+        self.phase = phase
+        self.phase_started = now
+
+    def set_progress(self, name: str, value: int):
+        self.progress[name] = value
+
+    def mark_ready(self):
+        logger.info(
+            f"Startup phase {self.phase} took {time.monotonic() - self.phase_started:.2f}s, "
+            f"ready to serve after {time.time() - self.started_at:.2f}s"
+        )
+        self.phase = "ready"
+        self.warmed = True
+
+    def mark_stopping(self):
+        """Fail readiness so load balancers drain this worker while it shuts down"""
+        self.stopping = True
+        self.phase = "stopping"
+
+    @property
+    def ready(self) -> bool:
+        return self.warmed and not self.stopping and self.database_status != "unhealthy"
+
+    def snapshot(self) -> Dict:
+        """Cached readiness details for probes"""
+        return {
+            "ready": self.ready,
+            "phase": self.phase,
+            "progress": self.progress,
+            "database_status": self.database_status,
+            "checked_at": int(self.checked_at),
+            "uptime": round(time.time() - self.started_at, 3)
+        }
+
+    async def refresh(self):
+        """Re-run the database and memory checks"""
+        try:
+            async with engine.connect() as conn:
+                await asyncio.wait_for(conn.execute(text("SELECT 1")), settings.health_check_timeout)
+            database_status = "healthy"
+        except Exception as e:
+            if self.database_status != "unhealthy":
+                logger.error(f"Database health check failed: {e}")
+            database_status = "unhealthy"
+        self.database_status = database_status
+
+        memory = psutil.virtual_memory()
+        self.memory_usage = {"total": memory.total, "available": memory.available, "percent": memory.percent}
+        self.checked_at = time.time()
+
+    async def _refresh_loop(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(settings.health_check_interval)
+
+    def start(self):
+        """Start refreshing the health checks in the background"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+class ReadinessGate:
+    """ASGI middleware answering API requests with 503 until startup warm-up has finished.
+
+    Placements must not race the canvas load, and a cold worker would serve
+    tiles from the database, so traffic that arrives early is turned away.
+    """
+
+    WARMING_UP = json.dumps({"detail": "Server is warming up"}).encode()
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if health.warmed or scope["type"] not in ("http", "websocket") or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        if scope["type"] == "websocket":
+            # 1013: try again later
+            await send({"type": "websocket.close", "code": 1013})
+            return
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [(b"content-type", b"application/json"), (b"retry-after", b"1")]
+        })
+        await send({"type": "http.response.body", "body": self.WARMING_UP})
+
+health = HealthState()
@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+from config import settings
+from typing import Dict, NamedTuple, Optional, Set, Tuple
+
+class AuthenticatedUser(NamedTuple):
+    """The user fields request handlers need; profile data is loaded separately"""
+    id: int
+    username: str
+    display_name: Optional[str]
+    is_active: bool
+    is_verified: bool
+
+class IdentityCache:
+    """TTL + LRU cache of bearer token -> authenticated user.
+
+    Saves the JWT decode and the users lookup on every authenticated request.
+    Entries never outlive the token's own expiry, and are dropped for a user
+    whenever their profile changes.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, AuthenticatedUser]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+
+    def get(self, token: str) -> Optional[AuthenticatedUser]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+
+        expires_at, user = entry
+        if expires_at <= time.time():
+            self._remove(token)
+            return None
+
+        self._entries.move_to_end(token)
+        return user
+
+    def put(self, token: str, user: AuthenticatedUser, token_expires_at: Optional[float] = None):
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+
+        expires_at = time.time() + self.ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+
+        self._remove(token)
+        self._entries[token] = (expires_at, user)
+        self._tokens_by_user.setdefault(user.id, set()).add(token)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        """Forget every cached token of a user, e.g. after a profile update"""
+        for token in self._tokens_by_user.pop(user_id, set()):
+            self._entries.pop(token, None)
+
+    def _remove(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            tokens = self._tokens_by_user.get(entry[1].id)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._tokens_by_user[entry[1].id]
+
+identity_cache = IdentityCache(settings.identity_cache_ttl, settings.identity_cache_size)
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import logging
+from fastapi import WebSocket
+from change_log import change_log
+from config import settings
+from services import PixelService
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class LiveUpdateHub:
+    """Pushes committed pixel changes to WebSocket clients.
+
+    A single broadcaster follows the change log, batches everything that arrived
+    within ws_batch_interval into one frame, and serializes it once for all
+    clients. Each client has a bounded send queue; a client that falls behind is
+    told to resync instead of stalling the broadcaster.
+    """
+
+    def __init__(self):
+        self.clients: Dict[WebSocket, asyncio.Queue] = {}
+        self.cursor = change_log.cursor
+        self._task: Optional[asyncio.Task] = None
+
+    async def serve(self, websocket: WebSocket):
+        """Run one client connection until it disconnects"""
+        await websocket.accept()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.ws_send_queue_size)
+        self.clients[websocket] = queue
+        self._ensure_broadcaster()
+
+        queue.put_nowait(json.dumps({"type": "hello", "cursor": change_log.cursor}))
+        sender = asyncio.create_task(self._send_loop(websocket, queue))
+        try:
+            # Clients don't send anything meaningful; reading detects disconnects
+            while True:
+                await websocket.receive_text()
+        except Exception:
+            pass
+        finally:
+            sender.cancel()
+            self.clients.pop(websocket, None)
+
+    def _ensure_broadcaster(self):
+        if self._task is None or self._task.done():
+            self.cursor = change_log.cursor
+            self._task = asyncio.create_task(self._broadcast_loop())
+
+    async def _broadcast_loop(self):
+        while self.clients:
+            if not await change_log.wait(self.cursor, settings.long_poll_timeout):
+                continue
+            # Let placements accumulate so each frame carries a batch
+            await asyncio.sleep(settings.ws_batch_interval)
+
+            frame = PixelService.get_updates(self.cursor, {})
+            self.cursor = frame["cursor"]
+            frame["type"] = "resync" if frame["resyncTiles"] else "updates"
+            self._publish(json.dumps(frame))
+
+    def _publish(self, message: str):
+        for websocket, queue in list(self.clients.items()):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Slow consumer: drop its backlog and have it catch up via /updates
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(json.dumps({"type": "overflow"}))
+
+    async def _send_loop(self, websocket: WebSocket, queue: asyncio.Queue):
+        try:
+            while True:
+                message = await queue.get()
+                await websocket.send_text(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"WebSocket send failed: {e}")
+            await websocket.close()
+
+live_updates = LiveUpdateHub()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Load generator for the Pixel Canvas API.
+
+Simulates a traffic mix against a running backend and writes a JSON report
+with throughput and p50/p95/p99 latency per endpoint:
+
+- viewers long-poll /api/updates and revalidate tiles with /api/state
+- users place pixels with /api/pixel, waiting out the cooldown in between
+- bots hammer /api/pixel/raw
+- login bursts hit /api/auth/login all at once
+
+Logins need activated accounts; --seed-users creates them directly in the
+database from DATABASE_URL (registration would require email verification).
+
+    python load_test.py --duration 60 --viewers 200 --users 50 --bots 5 --seed-users --output report.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+from typing import Dict, List, Optional
+
+import asyncpg
+import httpx
+
+from config import settings
+from cpu_pool import hash_password
+
+LOAD_TEST_PASSWORD = "load-test-password"
+
+# Second octet of the X-Forwarded-For address each kind of simulated client uses
+CLIENT_NETWORKS = {"viewer": 1, "user": 2, "bot": 3}
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(max(math.ceil(fraction * len(sorted_values)) - 1, 0), len(sorted_values) - 1)
+    return sorted_values[index]
+
+class Recorder:
+    """Latencies and status codes per endpoint"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+
+    def record(self, endpoint: str, status: str, latency: float):
+        self.latencies.setdefault(endpoint, []).append(latency)
+        counts = self.statuses.setdefault(endpoint, {})
+        counts[status] = counts.get(status, 0) + 1
+
+    def report(self, elapsed: float) -> Dict:
+        endpoints = {}
+        total = 0
+        for endpoint in sorted(self.latencies):
+            latencies = sorted(self.latencies[endpoint])
+            statuses = self.statuses[endpoint]
+            errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "3")))
+            total += len(latencies)
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "errors": errors,
+                "statuses": statuses,
+                "throughput_rps": round(len(latencies) / elapsed, 2),
+                "latency_ms": {
+                    "mean": round(sum(latencies) / len(latencies) * 1000, 3),
+                    "p50": round(percentile(latencies, 0.50) * 1000, 3),
+                    "p95": round(percentile(latencies, 0.95) * 1000, 3),
+                    "p99": round(percentile(latencies, 0.99) * 1000, 3),
+                    "max": round(latencies[-1] * 1000, 3)
+                }
+            }
+        return {
+            "duration_s": round(elapsed, 3),
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 2),
+            "endpoints": endpoints
+        }
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.recorder = Recorder()
+        self.deadline = 0.0
+        self.canvas_width = settings.canvas_width
+        self.canvas_height = settings.canvas_height
+        self.tile_size = settings.tile_size
+        self.tokens: List[str] = []
+        self.client: Optional[httpx.AsyncClient] = None
+
+    def running(self) -> bool:
+        return time.perf_counter() < self.deadline
+
+    async def request(self, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        """Send a request and record its latency and status (or transport error) under endpoint"""
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.record(endpoint, f"error:{type(e).__name__}", time.perf_counter() - start)
+            return None
+        self.recorder.record(endpoint, str(response.status_code), time.perf_counter() - start)
+        return response
+
+    def random_pixel(self) -> Dict[str, int]:
+        return {
+            "x": random.randrange(self.canvas_width),
+            "y": random.randrange(self.canvas_height),
+            "r": random.randrange(256),
+            "g": random.randrange(256),
+            "b": random.randrange(256)
+        }
+
+    @staticmethod
+    def client_ip(kind: str, index: int) -> str:
+        # Distinct forwarded addresses give every simulated client its own rate limit
+        return f"10.{CLIENT_NETWORKS[kind]}.{index // 256}.{index % 256}"
+
+    async def viewer(self, index: int):
+        headers = {"X-Forwarded-For": self.client_ip("viewer", index)}
+        tiles_x = -(-self.canvas_width // self.tile_size)
+        tiles_y = -(-self.canvas_height // self.tile_size)
+        checksums: Dict[str, str] = {}
+        cursor = None
+
+        while self.running():
+            params = {"wait": self.args.poll_wait}
+            if cursor is not None:
+                params["since"] = cursor
+            response = await self.request("GET /api/updates", "GET", "/api/updates", params=params, headers=headers)
+            if response is not None and response.status_code == 200:
+                cursor = response.json().get("cursor", cursor)
+
+            # Revalidate a tile now and then, as a client panning the canvas would
+            if random.random() < self.args.tile_fetch_ratio:
+                tile_x, tile_y = random.randrange(tiles_x), random.randrange(tiles_y)
+                key = f"{tile_x},{tile_y}"
+                params = {"tile_x": tile_x, "tile_y": tile_y, "format": self.args.tile_format}
+                if key in checksums:
+                    params["checksum"] = checksums[key]
+                response = await self.request("GET /api/state", "GET", "/api/state", params=params, headers=headers)
+                if response is not None and response.status_code == 200:
+                    if self.args.tile_format == "binary":
+                        checksums[key] = response.headers.get("X-Tile-Checksum", "")
+                    else:
+                        for tile in response.json()["tiles"]:
+                            checksums[key] = tile["checksum"]
+
+            await asyncio.sleep(self.args.poll_interval * random.uniform(0.5, 1.5))
+
+    async def user(self, index: int):
+        headers = {"X-Forwarded-For": self.client_ip("user", index)}
+        # Spread the first placements over one cooldown instead of all at once
+        await asyncio.sleep(random.uniform(0, self.args.cooldown))
+        while self.running():
+            # The first users place as the logged-in accounts, the rest anonymously
+            if index < len(self.tokens):
+                headers["Authorization"] = f"Bearer {self.tokens[index]}"
+            await self.request("POST /api/pixel", "POST", "/api/pixel", json=self.random_pixel(), headers=headers)
+            await asyncio.sleep(self.args.cooldown * random.uniform(1.0, 1.2))
+
+    async def bot(self, index: int):
+        headers = {"X-Forwarded-For": self.client_ip("bot", index)}
+        while self.running():
+            await self.request("POST /api/pixel/raw", "POST", "/api/pixel/raw", json=self.random_pixel(), headers=headers)
+            if self.args.bot_delay:
+                await asyncio.sleep(self.args.bot_delay)
+
+    async def login(self, index: int) -> Optional[str]:
+        response = await self.request("POST /api/auth/login", "POST", "/api/auth/login", json={
+            "username": f"{self.args.user_prefix}{index}",
+            "password": LOAD_TEST_PASSWORD
+        })
+        if response is not None and response.status_code == 200:
+            return response.json()["access_token"]
+        return None
+
+    async def login_bursts(self):
+        while self.running():
+            burst = [self.login(index) for index in range(self.args.login_burst)]
+            tokens = [token for token in await asyncio.gather(*burst) if token]
+            if tokens:
+                self.tokens = tokens
+            await asyncio.sleep(self.args.login_interval)
+
+    async def run(self) -> Dict:
+        limits = httpx.Limits(max_connections=self.args.max_connections, max_keepalive_connections=self.args.max_connections)
+        timeout = httpx.Timeout(self.args.poll_wait + 30)
+        async with httpx.AsyncClient(base_url=self.args.url, limits=limits, timeout=timeout) as self.client:
+            response = await self.client.get("/api/state", params={"tile_x": 0, "tile_y": 0})
+            response.raise_for_status()
+            state = response.json()
+            self.canvas_width, self.canvas_height = state["canvas_width"], state["canvas_height"]
+            self.tile_size = state["tile_size"]
+
+            start = time.perf_counter()
+            self.deadline = start + self.args.duration
+            tasks = [self.viewer(index) for index in range(self.args.viewers)]
+            tasks += [self.user(index) for index in range(self.args.users)]
+            tasks += [self.bot(index) for index in range(self.args.bots)]
+            if self.args.login_burst:
+                tasks.append(self.login_bursts())
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+
+        report = self.recorder.report(elapsed)
+        report["config"] = {key: value for key, value in vars(self.args).items() if key != "output"}
+        return report
+
+async def seed_users(prefix: str, count: int):
+    """Create (or reactivate) count verified accounts sharing LOAD_TEST_PASSWORD"""
+    hashed_password = hash_password(LOAD_TEST_PASSWORD)
+    conn = await asyncpg.connect(settings.database_url)
+    try:
+        await conn.executemany("""
+            INSERT INTO users (username, email, hashed_password, is_active, is_verified, created_at, total_pixels_placed)
+            VALUES ($1, $2, $3, TRUE, TRUE, now(), 0)
+            ON CONFLICT (username) DO UPDATE SET
+                hashed_password = EXCLUDED.hashed_password, is_active = TRUE, is_verified = TRUE
+        """, [(f"{prefix}{index}", f"{prefix}{index}@loadtest.invalid", hashed_password) for index in range(count)])
+    finally:
+        await conn.close()
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Pixel Canvas load generator")
+    parser.add_argument("--url", default="http://localhost:9696", help="Backend base URL")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to generate load for")
+    parser.add_argument("--viewers", type=int, default=50, help="Clients polling /api/updates and /api/state")
+    parser.add_argument("--users", type=int, default=20, help="Clients placing pixels with /api/pixel")
+    parser.add_argument("--bots", type=int, default=2, help="Clients hammering /api/pixel/raw")
+    parser.add_argument("--login-burst", type=int, default=10, help="Concurrent logins per burst (0 disables logins)")
+    parser.add_argument("--login-interval", type=float, default=10.0, help="Seconds between login bursts")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Mean seconds between viewer polls")
+    parser.add_argument("--poll-wait", type=float, default=0.0, help="Long-poll wait passed to /api/updates")
+    parser.add_argument("--tile-fetch-ratio", type=float, default=0.2, help="Chance a viewer poll also fetches a tile")
+    parser.add_argument("--tile-format", choices=("json", "binary"), default="binary")
+    parser.add_argument("--cooldown", type=float, default=float(settings.rate_limit_seconds), help="Seconds users wait between placements")
+    parser.add_argument("--bot-delay", type=float, default=0.0, help="Seconds bots wait between placements")
+    parser.add_argument("--max-connections", type=int, default=200)
+    parser.add_argument("--seed-users", action="store_true", help="Create --login-burst activated accounts in DATABASE_URL first")
+    parser.add_argument("--user-prefix", default="loadtest_", help="Username prefix of the load test accounts")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+async def main(args: argparse.Namespace):
+    if args.seed_users and args.login_burst:
+        await seed_users(args.user_prefix, args.login_burst)
+
+    report = await LoadTest(args).run()
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"Report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -1,14 +1,25 @@
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, PlainTextResponse
 import uvicorn
+import asyncio
+import os
 import time
 import logging
 from contextlib import asynccontextmanager
 
 from api import router as api_router
-from database import init_db
+from services import group_commit
+from canvas_jobs import canvas_jobs
+from database import ensure_schema, warm_pool, async_session, engine, get_pool_stats
+from canvas_buffer import canvas_buffer
+from canvas_counters import canvas_counters
+from placement_history import placement_history
+from canvas_checkpoint import canvas_checkpoint
+from cpu_pool import cpu_pool, CpuPoolBusy
+from metrics import MetricsMiddleware, Gauge, registry
+from health import health, ReadinessGate
+from shared_canvas import SharedCanvas, SHARED_CANVAS_ENV, attach_shared_canvas
 from config import settings
 
 # Configure logging
@@ -18,22 +29,92 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def warm_up(shared: bool):
+    """Startup phases that run while the server already answers /livez"""
+    health.begin_phase("pool")
+    try:
+        await warm_pool()
+        logger.info(f"Database pool warmed with {settings.db_pool_size} connections")
+    except Exception as e:
+        logger.error(f"Database pool warm-up failed: {e}")
+    
+    if not shared:
+        health.begin_phase("canvas")
+        try:
+            async with async_session() as db:
+                restored = await canvas_checkpoint.restore(db, lambda count: health.set_progress("placements_replayed", count))
+                if not restored:
+                    await canvas_buffer.load(db, lambda count: health.set_progress("pixels_loaded", count))
+        except Exception as e:
+            logger.error(f"Canvas buffer load failed, tile reads will use the database: {e}")
+    
+    health.begin_phase("counters")
+    try:
+        async with async_session() as db:
+            if shared:
+                await canvas_counters.load_activity(db)
+            else:
+                await canvas_counters.load(db)
+    except Exception as e:
+        logger.error(f"Canvas counters load failed, they will be corrected on reconciliation: {e}")
+    canvas_counters.start()
+    
+    if not shared:
+        try:
+            # Today's log partition must exist before placements start arriving
+            async with async_session() as db:
+                await placement_history.ensure_partitions(db)
+        except Exception as e:
+            logger.error(f"Placement log partition setup failed: {e}")
+    placement_history.start()
+    canvas_checkpoint.start()
+    health.mark_ready()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Handle application startup and shutdown"""
     # Startup
     logger.info("Starting Pixel Canvas Backend...")
-    try:
-        await init_db()
-        logger.info("Database initialized successfully")
-    except Exception as e:
-        logger.error(f"Database initialization failed: {e}")
-        raise
+    # In multi-worker mode the launcher already set up the schema and the canvas
+    shared = attach_shared_canvas()
+    if not shared:
+        health.begin_phase("schema")
+        try:
+            if await ensure_schema():
+                logger.info("Database schema created or upgraded")
+        except Exception as e:
+            logger.error(f"Database initialization failed: {e}")
+            raise
+    
+    cpu_pool.start()
+    health.start()
+    # The rest runs in the background; /readyz fails and the API answers 503 until it is done
+    warm_up_task = asyncio.create_task(warm_up(shared))
     
     yield
     
     # Shutdown
     logger.info("Shutting down Pixel Canvas Backend...")
+    health.mark_stopping()
+    warm_up_task.cancel()
+    try:
+        await warm_up_task
+    except asyncio.CancelledError:
+        pass
+    await health.stop()
+    await canvas_jobs.stop()
+    # Commit placements still waiting for their group before the final checkpoint
+    await group_commit.stop()
+    await canvas_counters.stop()
+    await placement_history.stop()
+    await canvas_checkpoint.stop()
+    if not shared and health.warmed:
+        # With several workers the launcher writes the final checkpoint once they exit
+        try:
+            await canvas_checkpoint.save()
+        except Exception as e:
+            logger.error(f"Final canvas checkpoint failed: {e}")
+    cpu_pool.shutdown()
 
 # Create FastAPI app
 app = FastAPI(
@@ -68,37 +149,41 @@ app.add_middleware(
         "X-Requested-With",
         "Origin",
         "Referer",
-        "User-Agent"
+        "User-Agent",
+        "X-Admin-Password"
     ],
     expose_headers=["*"],
     max_age=86400  # 24 hours
 )
 
-# Add request/response logging middleware
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    
-    # Log request
-    logger.info(f"Request: {request.method} {request.url}")
-    
-    try:
-        response = await call_next(request)
-        
-        # Log response
-        process_time = time.time() - start_time
-        logger.info(f"Response: {response.status_code} - {process_time:.3f}s")
-        
-        return response
-    except Exception as e:
-        process_time = time.time() - start_time
-        logger.error(f"Request failed: {str(e)} - {process_time:.3f}s")
-        raise
+# API requests are turned away until startup warm-up has finished
+app.add_middleware(ReadinessGate)
+
+# Per-route request counts, latency and in-flight gauges, scraped from /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Pool gauges are read when scraped rather than updated on every checkout
+registry.register(Gauge(
+    "pixelcanvas_db_pool_connections", "Database pool connections by state", ["state"],
+    callback=lambda: {(state,): get_pool_stats()[state] for state in ("checked_in", "checked_out", "overflow")}
+))
+registry.register(Gauge(
+    "pixelcanvas_cpu_pool_jobs", "CPU pool jobs by state", ["state"],
+    callback=lambda: {("running",): cpu_pool.running, ("queued",): cpu_pool.queued}
+))
 
 # Global exception handler
+@app.exception_handler(CpuPoolBusy)
+async def cpu_pool_busy_handler(request: Request, exc: CpuPoolBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"}
+    )
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Unhandled exception: {str(exc)}")
+    logger.error(f"Unhandled exception on {request.method} {request.url.path}: {str(exc)}")
     return JSONResponse(
         status_code=500,
         content={"detail": "Internal server error"}
@@ -107,15 +192,33 @@ async def global_exception_handler(request: Request, exc: Exception):
 # Include API routes
 app.include_router(api_router, prefix="/api")
 
-# Health check endpoint
+# Health check endpoints; all of them answer from cached state
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "timestamp": int(time.time()),
-        "version": "2.0.0"
-    }
+    return JSONResponse(
+        status_code=200 if health.ready else 503,
+        content={
+            "status": "healthy" if health.ready else health.phase,
+            "timestamp": int(time.time()),
+            "version": "2.0.0"
+        }
+    )
+
+@app.get("/livez", include_in_schema=False)
+async def livez():
+    """Liveness probe: the event loop is answering"""
+    return PlainTextResponse("ok")
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Readiness probe: warmed up, not shutting down and the last database check passed"""
+    return JSONResponse(status_code=200 if health.ready else 503, content=health.snapshot())
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 # Root endpoint
 @app.get("/")
@@ -143,13 +246,38 @@ async def handle_options(request: Request):
         }
     )
 
+async def prepare_shared_canvas(segment: SharedCanvas):
+    """Set up the schema and load the canvas into a new shared segment before the workers start"""
+    segment.attach_all()
+    await ensure_schema()
+    async with async_session() as db:
+        if not await canvas_checkpoint.restore(db):
+            await canvas_buffer.load(db)
+        await canvas_counters.load(db)
+        await placement_history.ensure_partitions(db)
+    # The workers open their own connections
+    await engine.dispose()
+
+def run_server():
+    """Run uvicorn; with several workers they share one memory-mapped canvas"""
+    options = {"host": settings.host, "port": settings.port, "access_log": True, "log_level": "info"}
+    if settings.workers <= 1:
+        uvicorn.run(app, **options)
+        return
+    
+    segment = SharedCanvas(settings.shared_canvas_path, create=True)
+    try:
+        asyncio.run(prepare_shared_canvas(segment))
+        os.environ[SHARED_CANVAS_ENV] = segment.path
+        logger.info(f"Starting {settings.workers} workers sharing {segment.path}")
+        uvicorn.run("main:app", workers=settings.workers, **options)
+        try:
+            asyncio.run(canvas_checkpoint.save())
+        except Exception as e:
+            logger.error(f"Final canvas checkpoint failed: {e}")
+    finally:
+        segment.unlink()
+
 if __name__ == "__main__":
     logger.info("Starting Pixel Canvas Backend Server...")
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=9696,
-        reload=True,
-        access_log=True,
-        log_level="info"
-    ) 
\ No newline at end of file
+    run_server()
@@ -0,0 +1,188 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# Prometheus text exposition without a client library: recording is a dict
+# lookup and an add, cheap enough to leave on for every request.
+
+Labels = Tuple[str, ...]
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self.values.items()
+        ]
+
+class Gauge(Metric):
+    """A gauge set directly, or read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Union[float, Dict[Labels, float]]]] = None):
+        super().__init__(name, help, labelnames)
+        self.values: Dict[Labels, float] = {}
+        self.callback = callback
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, labels: Labels = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, value: float, labels: Labels = ()):
+        self.values[labels] = value
+
+    def samples(self) -> List[str]:
+        values = self.values
+        if self.callback is not None:
+            result = self.callback()
+            values = result if isinstance(result, dict) else {(): result}
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in values.items()
+        ]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last is +Inf), sum]
+        self.values: Dict[Labels, List] = {}
+
+    def observe(self, value: float, labels: Labels = ()):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        bucket_names = self.labelnames + ("le",)
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(bucket_names, labels + (_format_value(bound),))} {cumulative}"
+                )
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+registry = Registry()
+
+# HTTP
+http_requests = registry.register(Counter(
+    "pixelcanvas_http_requests_total", "HTTP requests by route and status", ["method", "route", "status"]
+))
+http_request_duration = registry.register(Histogram(
+    "pixelcanvas_http_request_duration_seconds", "HTTP request latency by route", ["method", "route"]
+))
+http_in_flight = registry.register(Gauge(
+    "pixelcanvas_http_requests_in_flight", "HTTP requests being handled", ["method"]
+))
+
+# Canvas
+pixels_placed = registry.register(Counter(
+    "pixelcanvas_pixels_placed_total", "Pixels written, by placement path", ["source"]
+))
+rate_limited = registry.register(Counter(
+    "pixelcanvas_rate_limited_total", "Placements rejected by rate limiting", ["stage"]
+))
+tile_reads = registry.register(Counter(
+    "pixelcanvas_tile_reads_total", "Tiles served, by encoding", ["format"]
+))
+checksum_computations = registry.register(Counter(
+    "pixelcanvas_tile_checksum_computations_total", "Tile checksum lookups, by source", ["source"]
+))
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route request counts, latency and in-flight requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc((method,))
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            http_in_flight.dec((method,))
+            # The matched route's template keeps the label set bounded
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            http_requests.inc((method, path, str(status)))
+            http_request_duration.observe(duration, (method, path))
@@ -60,8 +60,13 @@ async def migrate_database():
         await conn.execute("DROP TABLE IF EXISTS user_stats CASCADE;")
         await conn.execute("DROP TABLE IF EXISTS pixels CASCADE;")
         await conn.execute("DROP TABLE IF EXISTS tile_updates CASCADE;")
+        await conn.execute("DROP TABLE IF EXISTS canvas_counters CASCADE;")
+        await conn.execute("DROP TABLE IF EXISTS user_daily_stats CASCADE;")
+        await conn.execute("DROP TABLE IF EXISTS placement_log CASCADE;")
+        await conn.execute("DROP TABLE IF EXISTS canvas_keyframes CASCADE;")
         await conn.execute("DROP TABLE IF EXISTS email_verifications CASCADE;")
         await conn.execute("DROP TABLE IF EXISTS users CASCADE;")
+        await conn.execute("DROP TABLE IF EXISTS profile_pictures CASCADE;")
         
         print("Creating new tables with correct schema...")
         
@@ -80,6 +85,7 @@ async def migrate_database():
                 bio TEXT,
                 profile_picture BYTEA,
                 profile_picture_type VARCHAR(50),
+                profile_picture_hash VARCHAR(64),
                 total_pixels_placed INTEGER DEFAULT 0,
                 registration_ip VARCHAR(45)
             );
@@ -125,6 +131,7 @@ async def migrate_database():
         # Create indexes for user_stats
         await conn.execute("CREATE INDEX idx_user_stats_user ON user_stats (user_id);")
         await conn.execute("CREATE INDEX idx_user_stats_ip ON user_stats (ip_address);")
+        await conn.execute("CREATE UNIQUE INDEX uq_user_stats_ip ON user_stats (ip_address) WHERE user_id IS NULL;")
         
         # Create active_users table
         await conn.execute("""
@@ -139,6 +146,7 @@ async def migrate_database():
         # Create indexes for active_users
         await conn.execute("CREATE INDEX idx_active_users_user ON active_users (user_id);")
         await conn.execute("CREATE INDEX idx_active_users_ip ON active_users (ip_address);")
+        await conn.execute("CREATE UNIQUE INDEX uq_active_users_ip ON active_users (ip_address) WHERE user_id IS NULL;")
         
         # Create tile_updates table
         await conn.execute("""
@@ -146,10 +154,73 @@ async def migrate_database():
                 tile_x SMALLINT NOT NULL,
                 tile_y SMALLINT NOT NULL,
                 last_updated INTEGER NOT NULL,
+                checksum VARCHAR(16),
                 PRIMARY KEY (tile_x, tile_y)
             );
         """)
         
+        # Create user_daily_stats table
+        await conn.execute("""
+            CREATE TABLE user_daily_stats (
+                user_id INTEGER NOT NULL,
+                day DATE NOT NULL,
+                color INTEGER NOT NULL,
+                placements INTEGER NOT NULL DEFAULT 0,
+                last_placed INTEGER NOT NULL,
+                PRIMARY KEY (user_id, day, color)
+            );
+        """)
+        
+        # Create placement_log table, partitioned by day (the backend creates daily partitions)
+        await conn.execute("""
+            CREATE TABLE placement_log (
+                placed_at INTEGER NOT NULL,
+                id BIGSERIAL NOT NULL,
+                x SMALLINT NOT NULL,
+                y SMALLINT NOT NULL,
+                r SMALLINT NOT NULL,
+                g SMALLINT NOT NULL,
+                b SMALLINT NOT NULL,
+                user_id INTEGER,
+                ip_address VARCHAR(45),
+                PRIMARY KEY (placed_at, id)
+            ) PARTITION BY RANGE (placed_at);
+        """)
+        await conn.execute("CREATE TABLE placement_log_default PARTITION OF placement_log DEFAULT;")
+        
+        # Create canvas_keyframes table
+        await conn.execute("""
+            CREATE TABLE canvas_keyframes (
+                id SERIAL PRIMARY KEY,
+                taken_at INTEGER NOT NULL,
+                replay_from INTEGER NOT NULL,
+                width SMALLINT NOT NULL,
+                height SMALLINT NOT NULL,
+                data BYTEA NOT NULL
+            );
+        """)
+        await conn.execute("CREATE INDEX ix_canvas_keyframes_taken_at ON canvas_keyframes (taken_at);")
+        
+        # Create canvas_counters table
+        await conn.execute("""
+            CREATE TABLE canvas_counters (
+                name VARCHAR(50) PRIMARY KEY,
+                value BIGINT NOT NULL DEFAULT 0,
+                updated_at INTEGER NOT NULL
+            );
+        """)
+        
+        # Create profile_pictures table
+        await conn.execute("""
+            CREATE TABLE profile_pictures (
+                hash VARCHAR(64) NOT NULL,
+                size SMALLINT NOT NULL,
+                content_type VARCHAR(50) NOT NULL,
+                data BYTEA NOT NULL,
+                PRIMARY KEY (hash, size)
+            );
+        """)
+        
         # Create email_verifications table
         await conn.execute("""
             CREATE TABLE email_verifications (
@@ -172,7 +243,12 @@ async def migrate_database():
         print("- pixels: canvas pixel data with proper IP address storage")
         print("- user_stats: user/IP statistics with proper indexing")
         print("- active_users: activity tracking with proper IP address storage")
-        print("- tile_updates: tile modification timestamps")
+        print("- tile_updates: tile modification timestamps and checksums")
+        print("- user_daily_stats: per-user daily placement and color rollup")
+        print("- placement_log: append-only placement history, partitioned by day")
+        print("- canvas_keyframes: compressed canvas snapshots for time travel")
+        print("- canvas_counters: reconciled global canvas counters")
+        print("- profile_pictures: content-addressed profile pictures in every served size")
         print("- email_verifications: email verification tokens")
         
     except Exception as e:
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field, EmailStr, validator
 from typing import Optional, Dict, List
 from datetime import datetime
+import re
 
 class PixelRequest(BaseModel):
     x: int = Field(..., ge=0, le=1023)
@@ -21,6 +22,22 @@ class StateRequest(BaseModel):
     tile_x: int = Field(..., ge=0)
     tile_y: int = Field(..., ge=0)
     checksum: Optional[str] = None
+    format: Optional[str] = Field(None, regex="^(json|binary)$")
+
+class TilesRequest(BaseModel):
+    tiles: Optional[List[List[int]]] = None  # [[tile_x, tile_y], ...]; defaults to every tile
+    x1: Optional[int] = Field(None, ge=0)  # Or an inclusive rectangle of tile coordinates
+    y1: Optional[int] = Field(None, ge=0)
+    x2: Optional[int] = Field(None, ge=0)
+    y2: Optional[int] = Field(None, ge=0)
+    checksums: Dict[str, str] = {}  # "tile_x,tile_y" -> checksum the client holds
+    center_x: Optional[float] = None  # Viewport centre in canvas pixels; nearest tiles come first
+    center_y: Optional[float] = None
+    format: str = Field("json", regex="^(json|binary)$")
+    stream: bool = False
+
+class UpdatesRequest(BaseModel):
+    checksums: Dict[str, str] = {}  # "tile_x,tile_y" -> checksum the client holds
 
 class TileData(BaseModel):
     tile_x: int
@@ -35,6 +52,14 @@ class StateResponse(BaseModel):
     checksum_match: bool
     tiles: List[TileData]
 
+class TilesResponse(BaseModel):
+    canvas_width: int
+    canvas_height: int
+    tile_size: int
+    tiles: List[TileData]
+    unchanged: List[str]  # Requested tiles whose checksum already matched
+    cursor: Optional[int] = None  # Change log cursor from before the tiles were read, for /updates
+
 class UserStatsResponse(BaseModel):
     user_pixels: int
     total_pixels: int
@@ -59,10 +84,35 @@ class HealthResponse(BaseModel):
     uptime: float
     memory_usage: Dict[str, float]
     database_status: str
+    database_pool: Optional[Dict[str, float]] = None
+    cpu_pool: Optional[Dict[str, float]] = None
 
 class AdminScrambleRequest(BaseModel):
     password: str
 
+class AdminCanvasJobRequest(BaseModel):
+    password: str
+    operation: str = Field(..., regex="^(fill|pattern|clear|scramble)$")
+    # Region; width and height default to the rest of the canvas
+    x: int = Field(0, ge=0)
+    y: int = Field(0, ge=0)
+    width: Optional[int] = Field(None, gt=0)
+    height: Optional[int] = Field(None, gt=0)
+    # fill uses the first color, pattern cycles through them
+    colors: List[str] = Field(["#ffffff"], min_items=1, max_items=16)
+    pattern: str = Field("checkerboard", regex="^(checkerboard|rows|columns)$")
+    cell_size: int = Field(1, ge=1)
+    # scramble: random pixels to place, whether to clear the region first, RNG seed
+    pixels: int = Field(10000, ge=0)
+    clear: bool = True
+    seed: Optional[int] = None
+
+    @validator("colors", each_item=True)
+    def validate_color(cls, color):
+        if not re.fullmatch(r"#?[0-9a-fA-F]{6}", color):
+            raise ValueError("Colors must be #rrggbb")
+        return color
+
 # Authentication models
 class UserCreate(BaseModel):
     username: str = Field(..., min_length=3, max_length=50, regex="^[a-zA-Z0-9_-]+$")
@@ -95,6 +145,7 @@ class User(BaseModel):
     last_login: Optional[datetime] = None
     total_pixels_placed: int
     has_profile_picture: bool = False
+    profile_picture_hash: Optional[str] = None
 
     class Config:
         from_attributes = True
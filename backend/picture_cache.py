@@ -0,0 +1,33 @@
+from collections import OrderedDict
+from config import settings
+from typing import Optional, Tuple
+
+class PictureCache:
+    """Byte-bounded LRU of encoded profile pictures keyed by (hash, size).
+
+    Pictures are content addressed, so a cached entry can never go stale and
+    nothing needs invalidating; the least recently served ones simply age out.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[bytes, str]]" = OrderedDict()
+
+    def get(self, picture_hash: str, size: int) -> Optional[Tuple[bytes, str]]:
+        entry = self._entries.get((picture_hash, size))
+        if entry is not None:
+            self._entries.move_to_end((picture_hash, size))
+        return entry
+
+    def put(self, picture_hash: str, size: int, data: bytes, content_type: str):
+        if len(data) > self.max_bytes or (picture_hash, size) in self._entries:
+            return
+
+        self._entries[(picture_hash, size)] = (data, content_type)
+        self.size_bytes += len(data)
+        while self.size_bytes > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.size_bytes -= len(evicted)
+
+picture_cache = PictureCache(settings.profile_picture_cache_bytes)
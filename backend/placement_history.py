@@ -0,0 +1,232 @@
+import asyncio
+import calendar
+import logging
+import time
+import zlib
+import numpy as np
+from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, func, text
+from database import PlacementLog, CanvasKeyframe, async_session
+from canvas_buffer import canvas_buffer
+from shared_canvas import is_maintenance_leader
+from config import settings
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 86400
+PARTITIONS_AHEAD = 3  # Days of log partitions created in advance
+# Placements are stamped shortly before their transaction begins, so replay
+# starts this many seconds before the oldest open one; reapplying is harmless
+KEYFRAME_REPLAY_MARGIN = 10
+REPLAY_BATCH_SIZE = 50000
+
+# When the oldest transaction that has written anything and is still open began
+OLDEST_WRITE_TRANSACTION_SQL = text("""
+    SELECT floor(extract(epoch FROM min(xact_start)))::bigint FROM pg_stat_activity
+    WHERE datname = current_database() AND backend_xid IS NOT NULL AND pid <> pg_backend_pid()
+""")
+
+def partition_name(day_start: int) -> str:
+    return f"placement_log_{datetime.utcfromtimestamp(day_start):%Y%m%d}"
+
+def compress_keyframe(rgb: np.ndarray, present: np.ndarray) -> bytes:
+    return zlib.compress(rgb.tobytes() + np.packbits(present, axis=None).tobytes(), 6)
+
+def decompress_keyframe(data: bytes, width: int, height: int) -> Tuple[np.ndarray, np.ndarray]:
+    raw = zlib.decompress(data)
+    rgb_size = width * height * 3
+    rgb = np.frombuffer(raw[:rgb_size], dtype=np.uint8).reshape(height, width, 3).copy()
+    present = np.unpackbits(np.frombuffer(raw[rgb_size:], dtype=np.uint8), count=width * height)
+    return rgb, present.reshape(height, width).astype(bool)
+
+def latest_placements(rows: List[Tuple[int, int, int, int, int]], width: int, height: int) -> np.ndarray:
+    """Reduce (x, y, r, g, b) placements in order to the last one per pixel, as an (N, 5) array"""
+    data = np.array(rows, dtype=np.int32).reshape(-1, 5)
+    data = data[(data[:, 0] < width) & (data[:, 1] < height)]
+    keys = data[::-1, 1] * width + data[::-1, 0]
+    _, last = np.unique(keys, return_index=True)
+    return data[::-1][last]
+
+def apply_placements(rgb: np.ndarray, present: np.ndarray, rows: List[Tuple[int, int, int, int, int]]):
+    """Apply (x, y, r, g, b) placements in order, later ones winning"""
+    height, width = present.shape
+    data = latest_placements(rows, width, height)
+    rgb[data[:, 1], data[:, 0]] = data[:, 2:5]
+    present[data[:, 1], data[:, 0]] = True
+
+class PlacementHistory:
+    """Append-only placement log plus periodic canvas keyframes.
+
+    Every committed placement is also written to placement_log, which is range
+    partitioned by day so old history stays out of the way of recent queries
+    and can be dropped a partition at a time. Keyframes are compressed full
+    canvas snapshots; the canvas at any time is the nearest earlier keyframe
+    with the log replayed on top.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._reset_at = 0  # Placements before the last bulk rewrite are never replayed
+
+    async def ensure_partitions(self, db: AsyncSession, now: Optional[int] = None):
+        """Create log partitions for today and the next few days.
+
+        Each day is its own transaction, so one that can't be created (say, the
+        default partition already holds rows for it) doesn't hold up the rest.
+        """
+        today = (now or int(time.time())) // DAY_SECONDS * DAY_SECONDS
+        for day in range(PARTITIONS_AHEAD + 1):
+            day_start = today + day * DAY_SECONDS
+            try:
+                await db.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {partition_name(day_start)} PARTITION OF placement_log "
+                    f"FOR VALUES FROM ({day_start}) TO ({day_start + DAY_SECONDS})"
+                ))
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Could not create placement log partition {partition_name(day_start)}: {e}")
+
+    async def drop_expired(self, db: AsyncSession, now: Optional[int] = None):
+        """Drop log partitions and keyframes older than the retention period"""
+        if settings.history_retention_days <= 0:
+            return
+
+        cutoff = ((now or int(time.time())) // DAY_SECONDS - settings.history_retention_days) * DAY_SECONDS
+        # Keep the newest keyframe before the cutoff so the oldest kept day can still be rebuilt
+        result = await db.execute(
+            select(CanvasKeyframe.id, CanvasKeyframe.replay_from)
+            .where(CanvasKeyframe.taken_at < cutoff)
+            .order_by(CanvasKeyframe.taken_at.desc())
+            .limit(1)
+        )
+        anchor = result.first()
+        if anchor is None:
+            return
+
+        await db.execute(delete(CanvasKeyframe).where(CanvasKeyframe.id < anchor.id, CanvasKeyframe.taken_at < cutoff))
+        result = await db.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = 'placement_log' AND child.relname ~ '^placement_log_[0-9]{8}$'"
+        ))
+        for (name,) in result.all():
+            day_start = calendar.timegm(datetime.strptime(name[-8:], "%Y%m%d").timetuple())
+            if day_start + DAY_SECONDS <= anchor.replay_from:
+                await db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+        await db.commit()
+
+    async def capture_keyframe(self, db: AsyncSession, reset: bool = False) -> bool:
+        """Store a keyframe of the current canvas.
+
+        Pass reset=True right after a bulk rewrite of the canvas, so placements
+        from before the rewrite are never replayed over it.
+        """
+        if not canvas_buffer.loaded:
+            logger.warning("Canvas buffer not loaded, skipping keyframe")
+            return False
+
+        taken_at = int(time.time())
+        replay_from = await self.replay_start(db, taken_at)
+        rgb, present, _ = canvas_buffer.snapshot()
+        data = await asyncio.get_running_loop().run_in_executor(None, compress_keyframe, rgb, present)
+
+        if reset:
+            self._reset_at = taken_at
+
+        db.add(CanvasKeyframe(
+            taken_at=taken_at,
+            replay_from=max(replay_from, self._reset_at),
+            width=canvas_buffer.width,
+            height=canvas_buffer.height,
+            data=data
+        ))
+        await db.commit()
+        logger.info(f"Stored canvas keyframe ({len(data)} bytes)")
+        return True
+
+    async def replay_start(self, db: AsyncSession, taken_at: int) -> int:
+        """Earliest placed_at a canvas snapshot taken now has to replay the log from.
+
+        Call it before copying the canvas. A transaction still open at that
+        point may commit placements stamped long before, e.g. after a lock wait,
+        so replay reaches back to when the oldest open write transaction began.
+        """
+        result = await db.execute(OLDEST_WRITE_TRANSACTION_SQL)
+        oldest = result.scalar()
+        if oldest is not None:
+            taken_at = min(taken_at, oldest)
+        return taken_at - KEYFRAME_REPLAY_MARGIN
+
+    async def canvas_at(self, db: AsyncSession, timestamp: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Rebuild (rgb, present) as of a timestamp, or None if it predates the history"""
+        result = await db.execute(
+            select(CanvasKeyframe)
+            .where(CanvasKeyframe.taken_at <= timestamp)
+            .order_by(CanvasKeyframe.taken_at.desc(), CanvasKeyframe.id.desc())
+            .limit(1)
+        )
+        keyframe = result.scalar_one_or_none()
+        if keyframe is None:
+            return None
+
+        loop = asyncio.get_running_loop()
+        rgb, present = await loop.run_in_executor(
+            None, decompress_keyframe, keyframe.data, keyframe.width, keyframe.height
+        )
+
+        result = await db.stream(
+            select(PlacementLog.x, PlacementLog.y, PlacementLog.r, PlacementLog.g, PlacementLog.b)
+            .where(PlacementLog.placed_at >= keyframe.replay_from, PlacementLog.placed_at <= timestamp)
+            .order_by(PlacementLog.placed_at, PlacementLog.id)
+        )
+        async for rows in result.partitions(REPLAY_BATCH_SIZE):
+            apply_placements(rgb, present, rows)
+
+        return rgb, present
+
+    async def latest_keyframe_time(self, db: AsyncSession) -> Optional[int]:
+        result = await db.execute(select(CanvasKeyframe.taken_at).order_by(CanvasKeyframe.taken_at.desc()).limit(1))
+        return result.scalar()
+
+    async def last_reset_time(self, db: AsyncSession) -> Optional[int]:
+        """When the canvas was last bulk rewritten, as recorded by a reset keyframe"""
+        result = await db.execute(
+            select(func.max(CanvasKeyframe.taken_at)).where(CanvasKeyframe.replay_from >= CanvasKeyframe.taken_at)
+        )
+        return result.scalar()
+
+    async def _maintenance_loop(self):
+        while True:
+            try:
+                # With several workers only one of them keeps the history
+                if is_maintenance_leader():
+                    async with async_session() as db:
+                        now = int(time.time())
+                        await self.ensure_partitions(db, now)
+                        latest = await self.latest_keyframe_time(db)
+                        if latest is None or now - latest >= settings.keyframe_interval:
+                            await self.capture_keyframe(db)
+                        await self.drop_expired(db, now)
+            except Exception as e:
+                logger.error(f"Placement history maintenance failed: {e}")
+            await asyncio.sleep(min(settings.keyframe_interval, 3600))
+
+    def start(self):
+        """Start partition upkeep and periodic keyframes in the background"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._maintenance_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+placement_history = PlacementHistory()
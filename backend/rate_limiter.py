@@ -0,0 +1,135 @@
+import math
+import time
+from config import settings
+from typing import Dict, Optional, Tuple
+
+class MemoryRateLimiter:
+    """Per-process token buckets keyed by user id or IP.
+
+    Each bucket holds up to `burst` placements and refills one token every
+    `interval` seconds; with burst=1 this is the classic placement cooldown.
+    """
+
+    def __init__(self, interval: float, burst: int = 1, max_keys: int = 100000):
+        self.interval = interval
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated_at)
+
+    def _tokens(self, key: str, now: float) -> float:
+        tokens, updated_at = self.buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated_at) / self.interval)
+
+    async def acquire(self, key: str) -> Optional[int]:
+        """Take a token, or return the seconds to wait until one is available"""
+        if self.interval <= 0:
+            return None
+
+        now = time.time()
+        tokens = self._tokens(key, now)
+        if tokens < 1:
+            return max(math.ceil((1 - tokens) * self.interval), 1)
+
+        if len(self.buckets) >= self.max_keys and key not in self.buckets:
+            self._prune(now)
+        self.buckets[key] = (tokens - 1, now)
+        return None
+
+    async def refund(self, key: str):
+        """Give back a token taken for a placement that was not written"""
+        if key in self.buckets:
+            now = time.time()
+            self.buckets[key] = (min(self.burst, self._tokens(key, now) + 1), now)
+
+    async def remaining(self, key: str) -> Optional[int]:
+        """Seconds until the next placement is allowed, or None if allowed now"""
+        if self.interval <= 0 or key not in self.buckets:
+            return None
+        tokens = self._tokens(key, time.time())
+        if tokens >= 1:
+            return None
+        return max(math.ceil((1 - tokens) * self.interval), 1)
+
+    def _prune(self, now: float):
+        """Drop buckets that have refilled completely; they hold no state"""
+        full_after = self.burst * self.interval
+        self.buckets = {
+            key: state for key, state in self.buckets.items()
+            if now - state[1] < full_after
+        }
+
+# Token bucket in Redis so every worker shares the same limits. Returns the
+# milliseconds to wait, or 0 when a token was taken.
+ACQUIRE_SCRIPT = """
+local burst = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - ts) / interval)
+if tokens < 1 then
+    return math.ceil((1 - tokens) * interval)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * interval))
+return 0
+"""
+
+REFUND_SCRIPT = """
+local burst = tonumber(ARGV[1])
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(math.min(burst, tokens + 1)))
+end
+return 0
+"""
+
+class RedisRateLimiter:
+    """Token buckets shared between processes through a Redis-protocol server"""
+
+    KEY_PREFIX = "ratelimit:"
+
+    def __init__(self, client, interval: float, burst: int = 1):
+        self.client = client
+        self.interval_ms = interval * 1000
+        self.burst = burst
+        self._acquire = client.register_script(ACQUIRE_SCRIPT)
+        self._refund = client.register_script(REFUND_SCRIPT)
+
+    async def acquire(self, key: str) -> Optional[int]:
+        """Take a token, or return the seconds to wait until one is available"""
+        if self.interval_ms <= 0:
+            return None
+        wait_ms = await self._acquire(
+            keys=[self.KEY_PREFIX + key],
+            args=[self.burst, self.interval_ms, int(time.time() * 1000)]
+        )
+        return max(math.ceil(int(wait_ms) / 1000), 1) if int(wait_ms) > 0 else None
+
+    async def refund(self, key: str):
+        """Give back a token taken for a placement that was not written"""
+        await self._refund(keys=[self.KEY_PREFIX + key], args=[self.burst])
+
+    async def remaining(self, key: str) -> Optional[int]:
+        """Seconds until the next placement is allowed, or None if allowed now"""
+        if self.interval_ms <= 0:
+            return None
+        tokens, ts = await self.client.hmget(self.KEY_PREFIX + key, "tokens", "ts")
+        if tokens is None:
+            return None
+        elapsed_ms = time.time() * 1000 - float(ts)
+        tokens = min(self.burst, float(tokens) + elapsed_ms / self.interval_ms)
+        if tokens >= 1:
+            return None
+        return max(math.ceil((1 - tokens) * self.interval_ms / 1000), 1)
+
+def create_rate_limiter():
+    """Build the placement rate limiter selected by settings"""
+    if settings.rate_limit_backend == "redis":
+        import redis.asyncio as redis
+        client = redis.from_url(settings.redis_url)
+        return RedisRateLimiter(client, settings.rate_limit_seconds, settings.rate_limit_burst)
+    return MemoryRateLimiter(settings.rate_limit_seconds, settings.rate_limit_burst)
+
+rate_limiter = create_rate_limiter()
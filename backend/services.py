@@ -1,24 +1,381 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, text, delete, and_, or_, desc
-from sqlalchemy.orm import Session
-from database import Pixel, UserStats, ActiveUser, TileUpdate, User, EmailVerification
-from models import PixelRequest, RawPixelRequest, UserStatsResponse, UserCreate, UserLogin, Token, UserProfile, UserStats as UserStatsModel
+from sqlalchemy import select, func, text, and_, or_, desc, TextClause
+from sqlalchemy.orm import Session, undefer
+from sqlalchemy.dialects.postgresql import insert
+from database import async_session, Pixel, UserStats, ActiveUser, TileUpdate, User, EmailVerification, UserDailyStats, ProfilePicture
+from models import PixelRequest, RawPixelRequest, TilesRequest, UserStatsResponse, UserCreate, UserLogin, Token, UserProfile, UserStats as UserStatsModel, User as UserModel
 from config import settings
+from canvas_buffer import canvas_buffer, encode_tile, format_checksum
+from change_log import change_log
+from rate_limiter import rate_limiter
+from identity_cache import identity_cache, AuthenticatedUser
+from picture_cache import picture_cache
+from cpu_pool import cpu_pool, CpuPoolBusy, hash_password, check_password, process_profile_picture, PROFILE_PICTURE_SIZES
+from canvas_counters import canvas_counters
+from placement_history import latest_placements
+from metrics import pixels_placed as pixels_placed_metric, rate_limited, tile_reads, checksum_computations
+import asyncio
 import hashlib
+import logging
 import time
-import random
 import secrets
 import base64
-from typing import Optional, List, Dict, Tuple
-from passlib.context import CryptContext
+from typing import Optional, List, Dict, Tuple, AsyncIterator, NamedTuple
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from PIL import Image
-import io
-import magic
+import json
+import struct
+import numpy as np
 from email_service import EmailService
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+# Packed binary pixel record for bulk placement: x, y (u16 little-endian), r, g, b (u8)
+RAW_PIXEL_DTYPE = np.dtype([("x", "<u2"), ("y", "<u2"), ("r", "u1"), ("g", "u1"), ("b", "u1")])
+
+# Pixel placement pipeline: one statement claims the cooldown slot and, only if
+# that succeeded, writes the pixel, statistics, activity and tile row. The claim
+# is a conditional upsert, so concurrent placements can't both pass the check.
+SET_PIXEL_SQL_TEMPLATE = """
+    WITH claim AS (
+        INSERT INTO user_stats (ip_address, user_id, pixels_placed, last_placed)
+        VALUES ({stats_ip}, {stats_user}, 1, :now)
+        ON CONFLICT {identity_conflict} DO UPDATE SET
+            pixels_placed = user_stats.pixels_placed + 1,
+            last_placed = EXCLUDED.last_placed
+        WHERE user_stats.last_placed IS NULL
+           OR user_stats.last_placed <= CAST(:now AS INTEGER) - CAST(:cooldown AS INTEGER)
+        RETURNING pixels_placed
+    ), pixel AS (
+        INSERT INTO pixels (x, y, r, g, b, ip_address, user_id, last_updated, tile_x, tile_y)
+        SELECT CAST(:x AS SMALLINT), CAST(:y AS SMALLINT),
+               CAST(:r AS SMALLINT), CAST(:g AS SMALLINT), CAST(:b AS SMALLINT),
+               {pixel_ip}, {pixel_user}, CAST(:now AS INTEGER),
+               CAST(:tile_x AS SMALLINT), CAST(:tile_y AS SMALLINT)
+        FROM claim
+        ON CONFLICT (x, y) DO UPDATE SET
+            r = EXCLUDED.r, g = EXCLUDED.g, b = EXCLUDED.b,
+            ip_address = EXCLUDED.ip_address, user_id = EXCLUDED.user_id,
+            last_updated = EXCLUDED.last_updated
+    ), active AS (
+        INSERT INTO active_users (ip_address, user_id, last_seen)
+        SELECT {stats_ip}, {stats_user}, CAST(:now AS INTEGER) FROM claim
+        ON CONFLICT {identity_conflict} DO UPDATE SET last_seen = EXCLUDED.last_seen
+    ), tile AS (
+        INSERT INTO tile_updates (tile_x, tile_y, last_updated, checksum)
+        SELECT CAST(:tile_x AS SMALLINT), CAST(:tile_y AS SMALLINT), CAST(:now AS INTEGER), CAST(:checksum AS VARCHAR)
+        FROM claim
+        ON CONFLICT (tile_x, tile_y) DO UPDATE SET
+            last_updated = EXCLUDED.last_updated, checksum = EXCLUDED.checksum
+    ), logged AS (
+        INSERT INTO placement_log (placed_at, x, y, r, g, b, user_id, ip_address)
+        SELECT CAST(:now AS INTEGER), CAST(:x AS SMALLINT), CAST(:y AS SMALLINT),
+               CAST(:r AS SMALLINT), CAST(:g AS SMALLINT), CAST(:b AS SMALLINT),
+               {pixel_user}, {pixel_ip}
+        FROM claim
+    ){account}
+    SELECT
+        (SELECT pixels_placed FROM claim) AS pixels_placed,
+        (SELECT last_placed FROM user_stats WHERE {identity_filter}) AS previous_last_placed
+"""
+
+SET_PIXEL_BY_USER_SQL = text(SET_PIXEL_SQL_TEMPLATE.format(
+    stats_ip="NULL",
+    stats_user="CAST(:user_id AS INTEGER)",
+    identity_conflict="(user_id)",
+    pixel_ip="NULL",
+    pixel_user="CAST(:user_id AS INTEGER)",
+    account=""", account AS (
+        UPDATE users SET total_pixels_placed = COALESCE(total_pixels_placed, 0) + 1
+        WHERE id = CAST(:user_id AS INTEGER) AND EXISTS (SELECT 1 FROM claim)
+    ), rollup AS (
+        INSERT INTO user_daily_stats (user_id, day, color, placements, last_placed)
+        SELECT CAST(:user_id AS INTEGER), CAST(:day AS DATE), CAST(:color AS INTEGER), 1, CAST(:now AS INTEGER)
+        FROM claim
+        ON CONFLICT (user_id, day, color) DO UPDATE SET
+            placements = user_daily_stats.placements + 1,
+            last_placed = GREATEST(user_daily_stats.last_placed, EXCLUDED.last_placed)
+    )""",
+    identity_filter="user_id = CAST(:user_id AS INTEGER)"
+))
+
+SET_PIXEL_BY_IP_SQL = text(SET_PIXEL_SQL_TEMPLATE.format(
+    stats_ip="CAST(:ip_address AS VARCHAR)",
+    stats_user="NULL",
+    identity_conflict="(ip_address) WHERE user_id IS NULL",
+    pixel_ip="CAST(:ip_address AS VARCHAR)",
+    pixel_user="NULL",
+    account="",
+    identity_filter="ip_address = CAST(:ip_address AS VARCHAR) AND user_id IS NULL"
+))
+
+SET_RAW_PIXEL_SQL = text("""
+    WITH pixel AS (
+        INSERT INTO pixels (x, y, r, g, b, ip_address, user_id, last_updated, tile_x, tile_y)
+        VALUES (:x, :y, :r, :g, :b, :ip_address, NULL, :now, :tile_x, :tile_y)
+        ON CONFLICT (x, y) DO UPDATE SET
+            r = EXCLUDED.r, g = EXCLUDED.g, b = EXCLUDED.b,
+            ip_address = EXCLUDED.ip_address, user_id = NULL,
+            last_updated = EXCLUDED.last_updated
+    ), logged AS (
+        INSERT INTO placement_log (placed_at, x, y, r, g, b, user_id, ip_address)
+        VALUES (:now, :x, :y, :r, :g, :b, NULL, :ip_address)
+    )
+    INSERT INTO tile_updates (tile_x, tile_y, last_updated, checksum)
+    VALUES (:tile_x, :tile_y, :now, :checksum)
+    ON CONFLICT (tile_x, tile_y) DO UPDATE SET
+        last_updated = EXCLUDED.last_updated, checksum = EXCLUDED.checksum
+""")
+
+# Frame prefix for each tile in a binary /api/tiles response: the length of the
+# rest of the frame, then the tile's 16-character checksum
+TILE_FRAME_HEADER = struct.Struct("<I16s")
+
+UPSERT_PIXELS_SQL = text("""
+    WITH p AS (
+        SELECT * FROM unnest(
+            CAST(:xs AS SMALLINT[]), CAST(:ys AS SMALLINT[]),
+            CAST(:rs AS SMALLINT[]), CAST(:gs AS SMALLINT[]), CAST(:bs AS SMALLINT[])
+        ) AS p(x, y, r, g, b)
+    ), logged AS (
+        INSERT INTO placement_log (placed_at, x, y, r, g, b, user_id, ip_address)
+        SELECT CAST(:timestamp AS INTEGER), p.x, p.y, p.r, p.g, p.b, NULL, CAST(:ip_address AS VARCHAR)
+        FROM p
+    )
+    INSERT INTO pixels (x, y, r, g, b, ip_address, user_id, last_updated, tile_x, tile_y)
+    SELECT p.x, p.y, p.r, p.g, p.b, CAST(:ip_address AS VARCHAR), NULL, CAST(:timestamp AS INTEGER),
+           p.x / CAST(:tile_size AS INTEGER), p.y / CAST(:tile_size AS INTEGER)
+    FROM p
+    ON CONFLICT (x, y) DO UPDATE SET
+        r = EXCLUDED.r, g = EXCLUDED.g, b = EXCLUDED.b,
+        ip_address = EXCLUDED.ip_address, user_id = NULL,
+        last_updated = EXCLUDED.last_updated
+""")
+
+UPSERT_TILE_UPDATES_SQL = text("""
+    INSERT INTO tile_updates (tile_x, tile_y, last_updated, checksum)
+    SELECT t.tile_x, t.tile_y, CAST(:timestamp AS INTEGER), t.checksum
+    FROM unnest(
+        CAST(:tile_xs AS SMALLINT[]), CAST(:tile_ys AS SMALLINT[]), CAST(:checksums AS VARCHAR[])
+    ) AS t(tile_x, tile_y, checksum)
+    ON CONFLICT (tile_x, tile_y) DO UPDATE SET
+        last_updated = EXCLUDED.last_updated, checksum = EXCLUDED.checksum
+""")
+
+# Consecutive raw placements of a commit group: every placement is logged, only
+# the last write of each pixel (flagged latest) reaches the pixels table
+GROUP_RAW_PIXELS_SQL = text("""
+    WITH p AS (
+        SELECT * FROM unnest(
+            CAST(:xs AS SMALLINT[]), CAST(:ys AS SMALLINT[]),
+            CAST(:rs AS SMALLINT[]), CAST(:gs AS SMALLINT[]), CAST(:bs AS SMALLINT[]),
+            CAST(:ip_addresses AS VARCHAR[]), CAST(:timestamps AS INTEGER[]), CAST(:latest AS BOOLEAN[])
+        ) AS p(x, y, r, g, b, ip_address, placed_at, latest)
+    ), logged AS (
+        INSERT INTO placement_log (placed_at, x, y, r, g, b, user_id, ip_address)
+        SELECT p.placed_at, p.x, p.y, p.r, p.g, p.b, NULL, p.ip_address
+        FROM p
+    )
+    INSERT INTO pixels (x, y, r, g, b, ip_address, user_id, last_updated, tile_x, tile_y)
+    SELECT p.x, p.y, p.r, p.g, p.b, p.ip_address, NULL, p.placed_at,
+           p.x / CAST(:tile_size AS INTEGER), p.y / CAST(:tile_size AS INTEGER)
+    FROM p
+    WHERE p.latest
+    ON CONFLICT (x, y) DO UPDATE SET
+        r = EXCLUDED.r, g = EXCLUDED.g, b = EXCLUDED.b,
+        ip_address = EXCLUDED.ip_address, user_id = NULL,
+        last_updated = EXCLUDED.last_updated
+""")
+
+class PendingPlacement(NamedTuple):
+    x: int
+    y: int
+    r: int
+    g: int
+    b: int
+    statement: Optional[TextClause]  # The claim pipeline of a rate-limited placement; None for raw ones
+    params: Dict
+    arrived: float
+    future: asyncio.Future
+
+class GroupCommitWriter:
+    """Commits concurrent pixel placements in groups, one transaction per group.
+
+    Placements arriving within group_commit_window seconds of the first one
+    (or until group_commit_max_size are waiting) share a transaction and its
+    WAL flush. Rate-limited placements still run their own claim statement,
+    in arrival order; a run of consecutive raw placements becomes one set-based
+    write in which repeated pixels keep only their last color. Tile checksums,
+    the canvas buffer and the change log are updated once per group, and each
+    caller gets its result only after the group has committed.
+    """
+
+    def __init__(self):
+        self._pending: List[PendingPlacement] = []
+        self._arrived: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._committing: Optional[asyncio.Future] = None
+
+    async def submit(self, x: int, y: int, r: int, g: int, b: int, statement: Optional[TextClause], params: Dict) -> Optional[Tuple]:
+        """Queue a placement and wait for its group to commit.
+
+        Returns the claim's (pixels_placed, previous_last_placed) row for a
+        rate-limited placement, None for a raw one; raises if the write failed.
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(PendingPlacement(x, y, r, g, b, statement, params, loop.time(), future))
+        self._arrived.set()
+        if len(self._pending) >= settings.group_commit_max_size:
+            self._full.set()
+        return await future
+
+    async def _commit_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._arrived.wait()
+            # Gather until the oldest placement has waited one window, or the group is full
+            remaining = self._pending[0].arrived + settings.group_commit_window - loop.time()
+            if remaining > 0:
+                try:
+                    await asyncio.wait_for(self._full.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+            group = self._pending[:settings.group_commit_max_size]
+            del self._pending[:len(group)]
+            if len(self._pending) < settings.group_commit_max_size:
+                self._full.clear()
+            if not self._pending:
+                self._arrived.clear()
+            # Shielded so stopping the loop never abandons a group halfway
+            self._committing = asyncio.ensure_future(self._commit(group))
+            try:
+                await asyncio.shield(self._committing)
+            except Exception as e:
+                # Keep the writer running for the placements still to come
+                logger.error(f"Group commit of {len(group)} placements failed: {e}")
+                for placement in group:
+                    if not placement.future.done():
+                        placement.future.set_exception(e)
+
+    async def _commit(self, group: List[PendingPlacement]):
+        try:
+            async with async_session() as db:
+                results, writes = await self._write(db, group)
+        except Exception as e:
+            if len(group) > 1:
+                # Retry one by one so a single bad placement doesn't fail the rest
+                for placement in group:
+                    await self._commit([placement])
+            elif not group[0].future.done():
+                group[0].future.set_exception(e)
+            return
+
+        try:
+            if len(writes):
+                xs, ys, rgb = writes[:, 0], writes[:, 1], writes[:, 2:5].astype(np.uint8)
+                canvas_counters.add_pixels(canvas_buffer.set_pixels(xs, ys, rgb))
+                change_log.extend(writes.tolist())
+        except Exception as e:
+            # The group is committed, so its callers still succeed; tiles resync from checksums
+            logger.error(f"Applying a committed group of {len(group)} placements failed: {e}")
+        for placement, result in zip(group, results):
+            # A caller that went away has cancelled its future
+            if not placement.future.done():
+                placement.future.set_result(result)
+
+    async def _write(self, db: AsyncSession, group: List[PendingPlacement]) -> Tuple[List[Optional[Tuple]], np.ndarray]:
+        """Write and commit a group; returns each placement's result and the distinct pixels written"""
+        results = []
+        written = []
+        index = 0
+        try:
+            while index < len(group):
+                placement = group[index]
+                if placement.statement is not None:
+                    result = await db.execute(placement.statement, placement.params)
+                    pixels_placed, previous_last_placed = result.one()
+                    results.append((pixels_placed, previous_last_placed))
+                    if pixels_placed is not None:
+                        written.append(placement[:5])
+                    index += 1
+                    continue
+
+                end = index
+                while end < len(group) and group[end].statement is None:
+                    end += 1
+                run = group[index:end]
+                await self._write_raw_run(db, run)
+                results.extend([None] * len(run))
+                written.extend(placement[:5] for placement in run)
+                index = end
+
+            writes = latest_placements(written, settings.canvas_width, settings.canvas_height)
+            if len(writes):
+                # Each statement stored its tile's checksum from before the group; store the final ones
+                tile_checksums = canvas_buffer.checksums_after_writes(writes[:, 0], writes[:, 1], writes[:, 2:5].astype(np.uint8))
+                await db.execute(UPSERT_TILE_UPDATES_SQL, {
+                    "timestamp": int(time.time()),
+                    "tile_xs": [tile_x for tile_x, _ in tile_checksums],
+                    "tile_ys": [tile_y for _, tile_y in tile_checksums],
+                    "checksums": list(tile_checksums.values())
+                })
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        return results, writes
+
+    @staticmethod
+    async def _write_raw_run(db: AsyncSession, run: List[PendingPlacement]):
+        data = np.array([placement[:5] for placement in run], dtype=np.int64)
+        # Flag the last write of each pixel in the run
+        keys = data[::-1, 1] * settings.canvas_width + data[::-1, 0]
+        _, last = np.unique(keys, return_index=True)
+        latest = np.zeros(len(run), dtype=bool)
+        latest[len(run) - 1 - last] = True
+        await db.execute(GROUP_RAW_PIXELS_SQL, {
+            "xs": data[:, 0].tolist(),
+            "ys": data[:, 1].tolist(),
+            "rs": data[:, 2].tolist(),
+            "gs": data[:, 3].tolist(),
+            "bs": data[:, 4].tolist(),
+            "ip_addresses": [placement.params["ip_address"] for placement in run],
+            "timestamps": [placement.params["now"] for placement in run],
+            "latest": latest.tolist(),
+            "tile_size": settings.tile_size
+        })
+
+    def start(self):
+        """Start committing groups in the background"""
+        if self._task is None or self._task.done():
+            self._arrived = asyncio.Event()
+            self._full = asyncio.Event()
+            if self._pending:
+                self._arrived.set()
+            self._task = asyncio.create_task(self._commit_loop())
+
+    async def stop(self):
+        """Stop the background loop and commit whatever is still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._committing is not None:
+            await self._committing
+            self._committing = None
+        while self._pending:
+            group = self._pending[:settings.group_commit_max_size]
+            del self._pending[:len(group)]
+            await self._commit(group)
+
+group_commit = GroupCommitWriter()
 
 class PixelService:
     @staticmethod
@@ -38,64 +395,70 @@ class PixelService:
         if not all(0 <= val <= 255 for val in [pixel_data.r, pixel_data.g, pixel_data.b]):
             return False, "Invalid RGB values"
         
-        # Check rate limit
-        if user_id:
-            rate_limit_error = await PixelService._check_user_rate_limit(db, user_id)
-        else:
-            rate_limit_error = await PixelService._check_ip_rate_limit(db, ip_address)
-        
-        if rate_limit_error:
-            return False, rate_limit_error
+        # Check rate limit in memory so rejected placements never reach the database
+        rate_limit_key = f"user:{user_id}" if user_id else f"ip:{ip_address}"
+        wait = await rate_limiter.acquire(rate_limit_key)
+        if wait:
+            rate_limited.inc(("limiter",))
+            return False, f"Rate limited. Wait {wait} seconds."
         
-        # Check for existing pixel
-        existing_pixel = await PixelService.get_pixel(db, pixel_data.x, pixel_data.y)
         timestamp = int(time.time())
-        
-        if existing_pixel:
-            # Update existing pixel
-            existing_pixel.r = pixel_data.r
-            existing_pixel.g = pixel_data.g
-            existing_pixel.b = pixel_data.b
-            existing_pixel.ip_address = ip_address if not user_id else None
-            existing_pixel.user_id = user_id
-            existing_pixel.last_updated = timestamp
-            existing_pixel.tile_x = pixel_data.x // settings.tile_size
-            existing_pixel.tile_y = pixel_data.y // settings.tile_size
-        else:
-            # Create new pixel
-            new_pixel = Pixel(
-                x=pixel_data.x,
-                y=pixel_data.y,
-                r=pixel_data.r,
-                g=pixel_data.g,
-                b=pixel_data.b,
-                ip_address=ip_address if not user_id else None,
-                user_id=user_id,
-                last_updated=timestamp,
-                tile_x=pixel_data.x // settings.tile_size,
-                tile_y=pixel_data.y // settings.tile_size
-            )
-            db.add(new_pixel)
-        
-        # Update statistics
+        # The database claim is a durable backstop for the cooldown; with bursts
+        # enabled the limiter alone decides
+        cooldown = max(settings.rate_limit_seconds, 0) if settings.rate_limit_burst <= 1 else 0
+        params = {
+            "x": pixel_data.x,
+            "y": pixel_data.y,
+            "r": pixel_data.r,
+            "g": pixel_data.g,
+            "b": pixel_data.b,
+            "now": timestamp,
+            "cooldown": cooldown,
+            "tile_x": pixel_data.x // settings.tile_size,
+            "tile_y": pixel_data.y // settings.tile_size,
+            "checksum": canvas_buffer.checksum_after_write(pixel_data.x, pixel_data.y, pixel_data.r, pixel_data.g, pixel_data.b)
+        }
         if user_id:
-            await PixelService._update_user_stats_by_user(db, user_id, timestamp)
-            await PixelService._update_active_user(db, None, user_id, timestamp)
+            statement = SET_PIXEL_BY_USER_SQL
+            params["user_id"] = user_id
+            params["day"] = datetime.utcfromtimestamp(timestamp).date()
+            params["color"] = (pixel_data.r << 16) | (pixel_data.g << 8) | pixel_data.b
         else:
-            await PixelService._update_user_stats_by_ip(db, ip_address, timestamp)
-            await PixelService._update_active_user(db, ip_address, None, timestamp)
-        
-        # Update tile timestamp
-        tile_x = pixel_data.x // settings.tile_size
-        tile_y = pixel_data.y // settings.tile_size
-        await PixelService._update_tile_timestamp(db, tile_x, tile_y, timestamp)
+            statement = SET_PIXEL_BY_IP_SQL
+            params["ip_address"] = ip_address
         
         try:
-            await db.commit()
-            return True, None
+            if settings.group_commit:
+                # Committed together with concurrent placements; the group applies it to the buffer
+                pixels_placed, previous_last_placed = await group_commit.submit(
+                    pixel_data.x, pixel_data.y, pixel_data.r, pixel_data.g, pixel_data.b, statement, params
+                )
+            else:
+                result = await db.execute(statement, params)
+                pixels_placed, previous_last_placed = result.one()
+                if pixels_placed is None:
+                    await db.rollback()
+                else:
+                    await db.commit()
         except Exception as e:
             await db.rollback()
+            await rate_limiter.refund(rate_limit_key)
             return False, f"Database error: {str(e)}"
+        
+        if pixels_placed is None:
+            # The cooldown claim failed, so nothing was written
+            rate_limited.inc(("database",))
+            # A concurrent first placement may not be visible to this snapshot yet
+            wait = cooldown - (timestamp - (previous_last_placed or timestamp))
+            return False, f"Rate limited. Wait {max(wait, 1)} seconds."
+        
+        if not settings.group_commit:
+            if canvas_buffer.set_pixel(pixel_data.x, pixel_data.y, pixel_data.r, pixel_data.g, pixel_data.b):
+                canvas_counters.add_pixels(1)
+            change_log.append(pixel_data.x, pixel_data.y, pixel_data.r, pixel_data.g, pixel_data.b)
+        canvas_counters.touch(rate_limit_key, timestamp)
+        pixels_placed_metric.inc(("user" if user_id else "ip",))
+        return True, None
 
     @staticmethod
     async def set_raw_pixel(db: AsyncSession, pixel_data: RawPixelRequest, ip_address: str) -> Tuple[bool, Optional[str]]:
@@ -108,178 +471,148 @@ class PixelService:
         if not all(0 <= val <= 255 for val in [pixel_data.r, pixel_data.g, pixel_data.b]):
             return False, "Invalid RGB values"
         
-        # Check for existing pixel
-        existing_pixel = await PixelService.get_pixel(db, pixel_data.x, pixel_data.y)
-        timestamp = int(time.time())
-        
-        if existing_pixel:
-            # Update existing pixel
-            existing_pixel.r = pixel_data.r
-            existing_pixel.g = pixel_data.g
-            existing_pixel.b = pixel_data.b
-            existing_pixel.ip_address = ip_address
-            existing_pixel.user_id = None  # Raw pixels are not associated with users
-            existing_pixel.last_updated = timestamp
-            existing_pixel.tile_x = pixel_data.x // settings.tile_size
-            existing_pixel.tile_y = pixel_data.y // settings.tile_size
-        else:
-            # Create new pixel
-            new_pixel = Pixel(
-                x=pixel_data.x,
-                y=pixel_data.y,
-                r=pixel_data.r,
-                g=pixel_data.g,
-                b=pixel_data.b,
-                ip_address=ip_address,
-                user_id=None,
-                last_updated=timestamp,
-                tile_x=pixel_data.x // settings.tile_size,
-                tile_y=pixel_data.y // settings.tile_size
-            )
-            db.add(new_pixel)
-        
-        # Update tile timestamp
-        tile_x = pixel_data.x // settings.tile_size
-        tile_y = pixel_data.y // settings.tile_size
-        await PixelService._update_tile_timestamp(db, tile_x, tile_y, timestamp)
-        
         try:
-            await db.commit()
-            return True, None
+            if settings.group_commit:
+                await group_commit.submit(pixel_data.x, pixel_data.y, pixel_data.r, pixel_data.g, pixel_data.b, None, {
+                    "ip_address": ip_address,
+                    "now": int(time.time())
+                })
+            else:
+                await db.execute(SET_RAW_PIXEL_SQL, {
+                    "x": pixel_data.x,
+                    "y": pixel_data.y,
+                    "r": pixel_data.r,
+                    "g": pixel_data.g,
+                    "b": pixel_data.b,
+                    "ip_address": ip_address,
+                    "now": int(time.time()),
+                    "tile_x": pixel_data.x // settings.tile_size,
+                    "tile_y": pixel_data.y // settings.tile_size,
+                    "checksum": canvas_buffer.checksum_after_write(pixel_data.x, pixel_data.y, pixel_data.r, pixel_data.g, pixel_data.b)
+                })
+                await db.commit()
         except Exception as e:
             await db.rollback()
             return False, f"Database error: {str(e)}"
+        
+        if not settings.group_commit:
+            if canvas_buffer.set_pixel(pixel_data.x, pixel_data.y, pixel_data.r, pixel_data.g, pixel_data.b):
+                canvas_counters.add_pixels(1)
+            change_log.append(pixel_data.x, pixel_data.y, pixel_data.r, pixel_data.g, pixel_data.b)
+        pixels_placed_metric.inc(("raw",))
+        return True, None
 
     @staticmethod
-    async def _check_user_rate_limit(db: AsyncSession, user_id: int) -> Optional[str]:
-        """Check rate limit for authenticated user"""
-        if settings.rate_limit_seconds <= 0:
-            return None
-        
-        result = await db.execute(
-            select(UserStats.last_placed).where(UserStats.user_id == user_id)
-        )
-        last_placed = result.scalar_one_or_none()
-        
-        if last_placed:
-            time_since_last = int(time.time()) - last_placed
-            if time_since_last < settings.rate_limit_seconds:
-                return f"Rate limited. Wait {settings.rate_limit_seconds - time_since_last} seconds."
+    def parse_raw_pixel_batch(body: bytes, content_type: str) -> Tuple[Optional[np.ndarray], Optional[str]]:
+        """Parse a bulk placement body into an (n, 5) array of x, y, r, g, b"""
+        if content_type.startswith("application/octet-stream"):
+            if len(body) % RAW_PIXEL_DTYPE.itemsize:
+                return None, f"Binary body must be a multiple of {RAW_PIXEL_DTYPE.itemsize} bytes"
+            records = np.frombuffer(body, dtype=RAW_PIXEL_DTYPE)
+            pixels = np.stack([records[field].astype(np.int64) for field in RAW_PIXEL_DTYPE.names], axis=1)
+        else:
+            try:
+                items = json.loads(body).get("pixels") or []
+                if items and isinstance(items[0], dict):
+                    items = [[item["x"], item["y"], item["r"], item["g"], item["b"]] for item in items]
+                # NumPy would regroup short rows and truncate floats, so check every item first
+                if not isinstance(items, list) or not all(
+                    isinstance(item, list) and len(item) == 5 and all(type(value) is int for value in item)
+                    for item in items
+                ):
+                    raise ValueError("malformed pixels")
+                pixels = np.array(items, dtype=np.int64) if items else np.empty((0, 5), dtype=np.int64)
+                if pixels.ndim != 2 or pixels.shape[1] != 5:
+                    raise ValueError("malformed pixels")
+            except (ValueError, TypeError, KeyError, AttributeError, OverflowError):
+                return None, "Body must be {\"pixels\": [[x, y, r, g, b], ...]}"
         
-        return None
+        if len(pixels) > settings.max_batch_pixels:
+            return None, f"Too many pixels. Maximum batch size is {settings.max_batch_pixels}"
+        return pixels, None
 
     @staticmethod
-    async def _check_ip_rate_limit(db: AsyncSession, ip_address: str) -> Optional[str]:
-        """Check rate limit for anonymous user by IP"""
-        if settings.rate_limit_seconds <= 0:
-            return None
+    async def set_raw_pixels(db: AsyncSession, pixels: np.ndarray, ip_address: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """Set a batch of pixels without rate limiting (for bots) in one set-based write"""
+        xs, ys, colors = pixels[:, 0], pixels[:, 1], pixels[:, 2:5]
+        in_bounds = (xs >= 0) & (xs < settings.canvas_width) & (ys >= 0) & (ys < settings.canvas_height)
+        valid_color = ((colors >= 0) & (colors <= 255)).all(axis=1)
+        valid = in_bounds & valid_color
         
-        result = await db.execute(
-            select(UserStats.last_placed).where(UserStats.ip_address == ip_address)
-        )
-        last_placed = result.scalar_one_or_none()
-        
-        if last_placed:
-            time_since_last = int(time.time()) - last_placed
-            if time_since_last < settings.rate_limit_seconds:
-                return f"Rate limited. Wait {settings.rate_limit_seconds - time_since_last} seconds."
+        errors = []
+        for index in np.flatnonzero(~valid)[:100].tolist():
+            errors.append({
+                "index": index,
+                "error": "Coordinates out of bounds" if not in_bounds[index] else "Invalid RGB values"
+            })
         
-        return None
-
-    @staticmethod
-    async def _update_user_stats_by_user(db: AsyncSession, user_id: int, timestamp: int):
-        """Update user statistics for authenticated user"""
-        result = await db.execute(
-            select(UserStats).where(UserStats.user_id == user_id)
-        )
-        user_stat = result.scalar_one_or_none()
+        # Coalesce repeated coordinates so the last write in the batch wins
+        accepted = pixels[valid]
+        keys = accepted[:, 1] * settings.canvas_width + accepted[:, 0]
+        _, last_index = np.unique(keys[::-1], return_index=True)
+        writes = accepted[len(accepted) - 1 - last_index]
         
-        if user_stat:
-            user_stat.pixels_placed += 1
-            user_stat.last_placed = timestamp
-        else:
-            user_stat = UserStats(
-                ip_address=None,
-                user_id=user_id,
-                pixels_placed=1,
-                last_placed=timestamp
-            )
-            db.add(user_stat)
+        result = {
+            "success": True,
+            "accepted": int(valid.sum()),
+            "rejected": int((~valid).sum()),
+            "written": len(writes),
+            "tiles": [],
+            "errors": errors
+        }
+        if not len(writes):
+            return result, None
         
-        # Also update user's total pixel count
-        user_result = await db.execute(select(User).where(User.id == user_id))
-        user = user_result.scalar_one_or_none()
-        if user:
-            user.total_pixels_placed += 1
-
-    @staticmethod
-    async def _update_user_stats_by_ip(db: AsyncSession, ip_address: str, timestamp: int):
-        """Update user statistics for anonymous user by IP"""
-        result = await db.execute(
-            select(UserStats).where(UserStats.ip_address == ip_address)
-        )
-        user_stat = result.scalar_one_or_none()
+        xs, ys, rgb = writes[:, 0], writes[:, 1], writes[:, 2:5].astype(np.uint8)
+        tile_checksums = canvas_buffer.checksums_after_writes(xs, ys, rgb)
+        timestamp = int(time.time())
         
-        if user_stat:
-            user_stat.pixels_placed += 1
-            user_stat.last_placed = timestamp
-        else:
-            user_stat = UserStats(
-                ip_address=ip_address,
-                user_id=None,
-                pixels_placed=1,
-                last_placed=timestamp
-            )
-            db.add(user_stat)
-
-    @staticmethod
-    async def _update_active_user(db: AsyncSession, ip_address: Optional[str], user_id: Optional[int], timestamp: int):
-        """Update active user tracking"""
-        if user_id:
-            result = await db.execute(
-                select(ActiveUser).where(ActiveUser.user_id == user_id)
-            )
-        else:
-            result = await db.execute(
-                select(ActiveUser).where(ActiveUser.ip_address == ip_address)
-            )
+        try:
+            await db.execute(UPSERT_PIXELS_SQL, {
+                "ip_address": ip_address,
+                "timestamp": timestamp,
+                "tile_size": settings.tile_size,
+                "xs": xs.tolist(),
+                "ys": ys.tolist(),
+                "rs": rgb[:, 0].tolist(),
+                "gs": rgb[:, 1].tolist(),
+                "bs": rgb[:, 2].tolist()
+            })
+            await db.execute(UPSERT_TILE_UPDATES_SQL, {
+                "timestamp": timestamp,
+                "tile_xs": [tile_x for tile_x, _ in tile_checksums],
+                "tile_ys": [tile_y for _, tile_y in tile_checksums],
+                "checksums": list(tile_checksums.values())
+            })
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            return None, f"Database error: {str(e)}"
         
-        active_user = result.scalar_one_or_none()
+        canvas_counters.add_pixels(canvas_buffer.set_pixels(xs, ys, rgb))
+        pixels_placed_metric.inc(("batch",), len(writes))
+        change_log.extend(writes.tolist())
         
-        if active_user:
-            active_user.last_seen = timestamp
-        else:
-            active_user = ActiveUser(ip_address=ip_address, user_id=user_id, last_seen=timestamp)
-            db.add(active_user)
+        result["tiles"] = [
+            {"tile_x": tile_x, "tile_y": tile_y, "checksum": checksum}
+            for (tile_x, tile_y), checksum in tile_checksums.items()
+        ]
+        return result, None
 
     @staticmethod
-    async def _update_tile_timestamp(db: AsyncSession, tile_x: int, tile_y: int, timestamp: int):
-        """Update tile modification timestamp"""
-        result = await db.execute(
-            select(TileUpdate).where(TileUpdate.tile_x == tile_x, TileUpdate.tile_y == tile_y)
-        )
-        tile_update = result.scalar_one_or_none()
+    async def get_tile_pixels(db: AsyncSession, tile_x: int, tile_y: int) -> List[Tuple[int, int, int, int, int]]:
+        """Get all pixels in a tile as (x, y, r, g, b) tuples"""
+        if canvas_buffer.loaded:
+            return canvas_buffer.get_tile_pixels(tile_x, tile_y)
         
-        if tile_update:
-            tile_update.last_updated = timestamp
-        else:
-            tile_update = TileUpdate(
-                tile_x=tile_x,
-                tile_y=tile_y,
-                last_updated=timestamp
-            )
-            db.add(tile_update)
-
-    @staticmethod
-    async def get_tile_pixels(db: AsyncSession, tile_x: int, tile_y: int) -> List[Pixel]:
-        """Get all pixels in a tile"""
+        # Fall back to the database if the buffer could not be loaded
         x_start = tile_x * settings.tile_size
         x_end = x_start + settings.tile_size
         y_start = tile_y * settings.tile_size
         y_end = y_start + settings.tile_size
         
         result = await db.execute(
-            select(Pixel).where(
+            select(Pixel.x, Pixel.y, Pixel.r, Pixel.g, Pixel.b).where(
                 and_(
                     Pixel.x >= x_start,
                     Pixel.x < x_end,
@@ -288,22 +621,141 @@ class PixelService:
                 )
             )
         )
-        return result.scalars().all()
+        return [tuple(row) for row in result.all()]
 
     @staticmethod
-    async def calculate_tile_checksum(db: AsyncSession, tile_x: int, tile_y: int) -> str:
-        """Calculate MD5 checksum for a tile"""
+    async def get_tile_bytes(db: AsyncSession, tile_x: int, tile_y: int) -> bytes:
+        """Get a tile encoded in the binary wire format"""
+        tile_reads.inc(("binary",))
+        if canvas_buffer.loaded:
+            return canvas_buffer.encode_tile(tile_x, tile_y)
+        
+        x_start, y_start, x_end, y_end = canvas_buffer.tile_bounds(tile_x, tile_y)
+        width = max(x_end - x_start, 0)
+        height = max(y_end - y_start, 0)
+        rgb = np.zeros((height, width, 3), dtype=np.uint8)
+        present = np.zeros((height, width), dtype=bool)
+        for x, y, r, g, b in await PixelService.get_tile_pixels(db, tile_x, tile_y):
+            if x < x_end and y < y_end:
+                rgb[y - y_start, x - x_start] = (r, g, b)
+                present[y - y_start, x - x_start] = True
+        
+        return encode_tile(tile_x, tile_y, rgb, present)
+
+    @staticmethod
+    async def get_tile_text(db: AsyncSession, tile_x: int, tile_y: int) -> str:
+        """Get a tile as base64 encoded "x,y,r,g,b|..." text"""
+        tile_reads.inc(("text",))
         pixels = await PixelService.get_tile_pixels(db, tile_x, tile_y)
+        tile_data = [f"{x},{y},{r},{g},{b}" for x, y, r, g, b in pixels]
+        return base64.b64encode("|".join(tile_data).encode()).decode()
+
+    @staticmethod
+    def select_tiles(tiles_request: TilesRequest) -> List[Tuple[int, int]]:
+        """Resolve a batch tile request to valid tiles, nearest the viewport centre first"""
+        if tiles_request.tiles is not None:
+            candidates = [tuple(tile[:2]) for tile in tiles_request.tiles if len(tile) >= 2]
+        else:
+            x1 = tiles_request.x1 if tiles_request.x1 is not None else 0
+            y1 = tiles_request.y1 if tiles_request.y1 is not None else 0
+            x2 = tiles_request.x2 if tiles_request.x2 is not None else canvas_buffer.tiles_x - 1
+            y2 = tiles_request.y2 if tiles_request.y2 is not None else canvas_buffer.tiles_y - 1
+            candidates = [
+                (tile_x, tile_y)
+                for tile_y in range(y1, min(y2, canvas_buffer.tiles_y - 1) + 1)
+                for tile_x in range(x1, min(x2, canvas_buffer.tiles_x - 1) + 1)
+            ]
         
-        # Create a sorted list of pixel data for consistent checksums
-        pixel_data = []
-        for pixel in pixels:
-            pixel_data.append(f"{pixel.x},{pixel.y},{pixel.r},{pixel.g},{pixel.b}")
+        tiles = list(dict.fromkeys(tile for tile in candidates if canvas_buffer.has_tile(*tile)))
         
-        pixel_data.sort()
-        combined_data = "|".join(pixel_data)
+        if tiles_request.center_x is not None and tiles_request.center_y is not None:
+            half = settings.tile_size / 2
+            tiles.sort(key=lambda tile: (
+                (tile[0] * settings.tile_size + half - tiles_request.center_x) ** 2
+                + (tile[1] * settings.tile_size + half - tiles_request.center_y) ** 2
+            ))
+        return tiles
+
+    @staticmethod
+    async def iter_changed_tiles(db: AsyncSession, tiles: List[Tuple[int, int]], checksums: Dict[str, str], binary: bool = False) -> AsyncIterator[Tuple[int, int, str, Optional[object]]]:
+        """Yield (tile_x, tile_y, checksum, payload) per tile; payload is None when the client's checksum matches"""
+        for tile_x, tile_y in tiles:
+            checksum = await PixelService.calculate_tile_checksum(db, tile_x, tile_y)
+            if checksums.get(f"{tile_x},{tile_y}") == checksum:
+                yield tile_x, tile_y, checksum, None
+            elif binary:
+                yield tile_x, tile_y, checksum, await PixelService.get_tile_bytes(db, tile_x, tile_y)
+            else:
+                yield tile_x, tile_y, checksum, await PixelService.get_tile_text(db, tile_x, tile_y)
+
+    @staticmethod
+    async def calculate_tile_checksum(db: AsyncSession, tile_x: int, tile_y: int) -> str:
+        """Get the incrementally maintained checksum for a tile"""
+        if canvas_buffer.loaded:
+            checksum_computations.inc(("buffer",))
+            return canvas_buffer.get_tile_checksum(tile_x, tile_y)
+        
+        checksum_computations.inc(("database",))
+        # Fall back to the checksum persisted with the last tile write
+        result = await db.execute(
+            select(TileUpdate.checksum).where(TileUpdate.tile_x == tile_x, TileUpdate.tile_y == tile_y)
+        )
+        return result.scalar_one_or_none() or format_checksum(0)
+
+    @staticmethod
+    def get_updates(since: Optional[int], checksums: Dict[str, str]) -> Dict:
+        """Get pixel changes after a change log cursor, or the tiles to resync"""
+        cursor = change_log.cursor
+        changes = change_log.since(since)
+        pixels = []
+        tile_checksums = {}
+        resync_tiles = []
+        
+        if changes is not None and len(changes) <= settings.updates_max_pixels:
+            # Coalesce repeated writes to the same pixel into the latest one
+            latest = {}
+            for x, y, r, g, b in zip(*(changes[field].tolist() for field in ("x", "y", "r", "g", "b"))):
+                latest[(x, y)] = (r, g, b)
+            
+            tile_size = settings.tile_size
+            pixels = [{"x": x, "y": y, "r": r, "g": g, "b": b} for (x, y), (r, g, b) in latest.items()]
+            for tile_x, tile_y in {(x // tile_size, y // tile_size) for x, y in latest}:
+                tile_checksums[f"{tile_x},{tile_y}"] = canvas_buffer.get_tile_checksum(tile_x, tile_y)
+        else:
+            # The cursor aged out (or is too far behind): name the tiles to refetch.
+            # Without a cursor the client only starts following from now on, so
+            # at most the tiles whose checksums it sent are checked
+            if checksums or since is None:
+                candidates = checksums.keys()
+            else:
+                candidates = [
+                    f"{tile_x},{tile_y}"
+                    for tile_y in range(canvas_buffer.tiles_y)
+                    for tile_x in range(canvas_buffer.tiles_x)
+                ]
+            
+            for tile_key in candidates:
+                try:
+                    tile_x, tile_y = (int(part) for part in tile_key.split(","))
+                except ValueError:
+                    continue
+                if not canvas_buffer.has_tile(tile_x, tile_y):
+                    continue
+                
+                current_checksum = canvas_buffer.get_tile_checksum(tile_x, tile_y)
+                if checksums.get(tile_key) != current_checksum:
+                    resync_tiles.append(tile_key)
+                    tile_checksums[tile_key] = current_checksum
         
-        return hashlib.md5(combined_data.encode()).hexdigest()
+        return {
+            "success": True,
+            "pixels": pixels,
+            "timestamp": int(time.time()),
+            "cursor": cursor,
+            "changedTiles": {},
+            "tileChecksums": tile_checksums,
+            "resyncTiles": resync_tiles
+        }
 
 class StatsService:
     @staticmethod
@@ -323,16 +775,9 @@ class StatsService:
         user_pixels = user_data[0] if user_data else 0
         last_placed = user_data[1] if user_data else None
         
-        # Get total pixels on canvas
-        result = await db.execute(select(func.count(Pixel.x)))
-        total_pixels = result.scalar() or 0
-        
-        # Get active users count
-        cutoff_time = int(time.time()) - 3600  # Last hour
-        result = await db.execute(
-            select(func.count().distinct()).select_from(ActiveUser).where(ActiveUser.last_seen > cutoff_time)
-        )
-        active_users = result.scalar() or 0
+        # Global counters are maintained incrementally, so these are free
+        total_pixels = canvas_counters.total_pixels
+        active_users = canvas_counters.active_users()
         
         # Calculate rate limit remaining
         rate_limit_remaining = None
@@ -349,50 +794,15 @@ class StatsService:
             rate_limit_remaining=rate_limit_remaining
         )
 
-class AdminService:
-    @staticmethod
-    async def scramble_canvas(db: AsyncSession) -> bool:
-        """Scramble the canvas with random pixels"""
-        try:
-            # Delete all existing pixels
-            await db.execute(delete(Pixel))
-            
-            # Generate random pixels
-            pixels_to_create = []
-            for _ in range(10000):  # Create 10k random pixels
-                x = random.randint(0, settings.canvas_width - 1)
-                y = random.randint(0, settings.canvas_height - 1)
-                r = random.randint(0, 255)
-                g = random.randint(0, 255)
-                b = random.randint(0, 255)
-                timestamp = int(time.time())
-                
-                pixel = Pixel(
-                    x=x, y=y, r=r, g=g, b=b,
-                    ip_address=None, user_id=None,
-                    last_updated=timestamp,
-                    tile_x=x // settings.tile_size,
-                    tile_y=y // settings.tile_size
-                )
-                pixels_to_create.append(pixel)
-            
-            db.add_all(pixels_to_create)
-            await db.commit()
-            return True
-            
-        except Exception as e:
-            await db.rollback()
-            return False
-
 # User Authentication Services
 class AuthService:
     @staticmethod
-    def verify_password(plain_password: str, hashed_password: str) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
+    async def verify_password(plain_password: str, hashed_password: str) -> bool:
+        return await cpu_pool.run(check_password, plain_password, hashed_password)
     
     @staticmethod
-    def get_password_hash(password: str) -> str:
-        return pwd_context.hash(password)
+    async def get_password_hash(password: str) -> str:
+        return await cpu_pool.run(hash_password, password)
     
     @staticmethod
     def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -422,7 +832,7 @@ class AuthService:
                     return None, "Email already registered"
             
             # Create user
-            hashed_password = AuthService.get_password_hash(user_data.password)
+            hashed_password = await AuthService.get_password_hash(user_data.password)
             user = User(
                 username=user_data.username,
                 email=user_data.email,
@@ -455,6 +865,8 @@ class AuthService:
             
             return user, None
             
+        except CpuPoolBusy:
+            raise
         except Exception as e:
             await db.rollback()
             return None, f"Registration failed: {str(e)}"
@@ -504,7 +916,7 @@ class AuthService:
         )
         user = result.scalar_one_or_none()
         
-        if user and AuthService.verify_password(password, user.hashed_password):
+        if user and await AuthService.verify_password(password, user.hashed_password):
             if user.is_active:
                 # Update last login
                 user.last_login = datetime.utcnow()
@@ -516,18 +928,31 @@ class AuthService:
         return None
     
     @staticmethod
-    async def get_user_by_token(db: AsyncSession, token: str) -> Optional[User]:
+    async def get_user_by_token(db: AsyncSession, token: str) -> Optional[AuthenticatedUser]:
         """Get user by JWT token"""
+        user = identity_cache.get(token)
+        if user is not None:
+            return user
+        
         try:
             payload = jwt.decode(token, settings.secret_key, algorithms=[settings.jwt_algorithm])
-            user_id: int = payload.get("sub")
+            user_id: int = payload.get("user_id")
             if user_id is None:
                 return None
         except JWTError:
             return None
         
-        result = await db.execute(select(User).where(User.id == user_id))
-        return result.scalar_one_or_none()
+        result = await db.execute(
+            select(User.id, User.username, User.display_name, User.is_active, User.is_verified)
+            .where(User.id == user_id)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        
+        user = AuthenticatedUser(*row)
+        identity_cache.put(token, user, payload.get("exp"))
+        return user
 
 class UserService:
     @staticmethod
@@ -547,6 +972,7 @@ class UserService:
                 user.bio = profile_data.bio
             
             await db.commit()
+            identity_cache.invalidate_user(user_id)
             return True, None
             
         except Exception as e:
@@ -567,24 +993,9 @@ class UserService:
             
             # Process image
             try:
-                image = Image.open(io.BytesIO(file_data))
-                
-                # Convert to RGB if necessary
-                if image.mode in ('RGBA', 'LA', 'P'):
-                    background = Image.new('RGB', image.size, (255, 255, 255))
-                    if image.mode == 'P':
-                        image = image.convert('RGBA')
-                    background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                    image = background
-                
-                # Resize to 200x200
-                image = image.resize((200, 200), Image.Resampling.LANCZOS)
-                
-                # Save as JPEG
-                output = io.BytesIO()
-                image.save(output, format='JPEG', quality=85, optimize=True)
-                processed_data = output.getvalue()
-                
+                pictures = await cpu_pool.run(process_profile_picture, file_data)
+            except CpuPoolBusy:
+                raise
             except Exception as e:
                 return False, f"Image processing failed: {str(e)}"
             
@@ -595,27 +1006,78 @@ class UserService:
             if not user:
                 return False, "User not found"
             
-            user.profile_picture = processed_data
+            picture_hash = hashlib.sha256(pictures[PROFILE_PICTURE_SIZES[0]]).hexdigest()
+            statement = insert(ProfilePicture).values([
+                {"hash": picture_hash, "size": size, "content_type": "image/jpeg", "data": data}
+                for size, data in pictures.items()
+            ])
+            await db.execute(statement.on_conflict_do_nothing())
+            
+            user.profile_picture_hash = picture_hash
             user.profile_picture_type = 'image/jpeg'
+            user.profile_picture = None
             
             await db.commit()
+            identity_cache.invalidate_user(user_id)
             return True, None
             
+        except CpuPoolBusy:
+            raise
         except Exception as e:
             await db.rollback()
             return False, f"Upload failed: {str(e)}"
     
     @staticmethod
-    async def get_profile_picture(db: AsyncSession, user_id: int) -> Tuple[Optional[bytes], Optional[str]]:
-        """Get user profile picture"""
+    async def get_profile(db: AsyncSession, user_id: int) -> Optional[UserModel]:
+        """Get a user's full profile without loading the picture itself"""
         result = await db.execute(
-            select(User.profile_picture, User.profile_picture_type).where(User.id == user_id)
+            select(User).options(undefer(User.bio)).where(User.id == user_id)
+        )
+        user = result.scalar_one_or_none()
+        if not user:
+            return None
+        
+        return UserModel(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            display_name=user.display_name,
+            bio=user.bio,
+            is_active=user.is_active,
+            is_verified=user.is_verified,
+            created_at=user.created_at,
+            last_login=user.last_login,
+            total_pixels_placed=user.total_pixels_placed or 0,
+            has_profile_picture=user.profile_picture_hash is not None,
+            profile_picture_hash=user.profile_picture_hash
+        )
+    
+    @staticmethod
+    async def get_profile_picture_hash(db: AsyncSession, user_id: int) -> Optional[str]:
+        """Get the content hash of a user's current profile picture"""
+        result = await db.execute(select(User.profile_picture_hash).where(User.id == user_id))
+        return result.scalar_one_or_none()
+    
+    @staticmethod
+    async def get_profile_picture(db: AsyncSession, picture_hash: str, size: int) -> Tuple[Optional[bytes], Optional[str]]:
+        """Get a profile picture by content hash, in the requested size if it was generated"""
+        cached = picture_cache.get(picture_hash, size)
+        if cached:
+            return cached
+        
+        # Pictures migrated from the users table only exist in the canonical size
+        result = await db.execute(
+            select(ProfilePicture.data, ProfilePicture.content_type)
+            .where(ProfilePicture.hash == picture_hash)
+            .order_by((ProfilePicture.size == size).desc(), ProfilePicture.size.desc())
+            .limit(1)
         )
         data = result.first()
+        if not data:
+            return None, None
         
-        if data and data[0]:
-            return data[0], data[1]
-        return None, None
+        picture_cache.put(picture_hash, size, data[0], data[1])
+        return data[0], data[1]
     
     @staticmethod
     async def get_user_statistics(db: AsyncSession, user_id: int) -> Optional[UserStatsModel]:
@@ -623,9 +1085,9 @@ class UserService:
         try:
             # Get user info
             result = await db.execute(
-                select(User).where(User.id == user_id)
+                select(User.created_at, User.total_pixels_placed).where(User.id == user_id)
             )
-            user = result.scalar_one_or_none()
+            user = result.first()
             
             if not user:
                 return None
@@ -633,81 +1095,45 @@ class UserService:
             # Calculate account age
             account_age_days = (datetime.utcnow() - user.created_at).days
             
-            # Get pixel placement stats by time period
-            now = datetime.utcnow()
-            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            week_start = today_start - timedelta(days=7)
-            month_start = today_start - timedelta(days=30)
-            
-            # Get pixels placed in different time periods
-            pixels_today = await db.execute(
-                select(func.count(Pixel.x)).where(
-                    and_(
-                        Pixel.user_id == user_id,
-                        Pixel.last_updated >= int(today_start.timestamp())
-                    )
-                )
-            )
-            pixels_today = pixels_today.scalar() or 0
+            # Everything else comes from the user's daily rollup rows (UTC days)
+            today = datetime.utcnow().date()
+            week_start = today - timedelta(days=7)
+            month_start = today - timedelta(days=30)
             
-            pixels_week = await db.execute(
-                select(func.count(Pixel.x)).where(
-                    and_(
-                        Pixel.user_id == user_id,
-                        Pixel.last_updated >= int(week_start.timestamp())
-                    )
-                )
+            result = await db.execute(
+                select(UserDailyStats.day, UserDailyStats.color, UserDailyStats.placements, UserDailyStats.last_placed)
+                .where(UserDailyStats.user_id == user_id)
             )
-            pixels_week = pixels_week.scalar() or 0
             
-            pixels_month = await db.execute(
-                select(func.count(Pixel.x)).where(
-                    and_(
-                        Pixel.user_id == user_id,
-                        Pixel.last_updated >= int(month_start.timestamp())
-                    )
-                )
-            )
-            pixels_month = pixels_month.scalar() or 0
+            pixels_today = pixels_week = pixels_month = 0
+            last_pixel_timestamp = None
+            color_counts: Dict[int, int] = {}
+            activity_heatmap = {
+                (today - timedelta(days=i)).strftime('%Y-%m-%d'): 0
+                for i in range(30)
+            }
+            for day, color, placements, last_placed in result.all():
+                if day >= today:
+                    pixels_today += placements
+                if day >= week_start:
+                    pixels_week += placements
+                if day >= month_start:
+                    pixels_month += placements
+                day_key = day.strftime('%Y-%m-%d')
+                if day_key in activity_heatmap:
+                    activity_heatmap[day_key] += placements
+                if last_pixel_timestamp is None or last_placed > last_pixel_timestamp:
+                    last_pixel_timestamp = last_placed
+                color_counts[color] = color_counts.get(color, 0) + placements
             
-            # Get last pixel placed
-            result = await db.execute(
-                select(func.max(Pixel.last_updated)).where(Pixel.user_id == user_id)
-            )
-            last_pixel_timestamp = result.scalar()
             last_pixel_placed = datetime.fromtimestamp(last_pixel_timestamp) if last_pixel_timestamp else None
             
             # Get favorite colors
-            result = await db.execute(
-                select(Pixel.r, Pixel.g, Pixel.b, func.count().label('count'))
-                .where(Pixel.user_id == user_id)
-                .group_by(Pixel.r, Pixel.g, Pixel.b)
-                .order_by(desc('count'))
-                .limit(10)
-            )
             favorite_colors = [
-                {"r": row[0], "g": row[1], "b": row[2], "count": row[3]}
-                for row in result.fetchall()
+                {"r": color >> 16, "g": (color >> 8) & 0xFF, "b": color & 0xFF, "count": count}
+                for color, count in sorted(color_counts.items(), key=lambda item: item[1], reverse=True)[:10]
             ]
             
-            # Generate activity heatmap (last 30 days)
-            activity_heatmap = {}
-            for i in range(30):
-                day = today_start - timedelta(days=i)
-                day_end = day + timedelta(days=1)
-                
-                result = await db.execute(
-                    select(func.count(Pixel.x)).where(
-                        and_(
-                            Pixel.user_id == user_id,
-                            Pixel.last_updated >= int(day.timestamp()),
-                            Pixel.last_updated < int(day_end.timestamp())
-                        )
-                    )
-                )
-                count = result.scalar() or 0
-                activity_heatmap[day.strftime('%Y-%m-%d')] = count
-            
             return UserStatsModel(
                 total_pixels_placed=user.total_pixels_placed,
                 pixels_placed_today=pixels_today,
@@ -0,0 +1,137 @@
+import fcntl
+import logging
+import mmap
+import os
+import numpy as np
+from canvas_buffer import canvas_buffer
+from canvas_counters import canvas_counters
+from change_log import change_log, CHANGE_DTYPE
+from config import settings
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Set by the launcher so workers attach to the segment instead of loading the canvas
+SHARED_CANVAS_ENV = "PIXELCANVAS_SHARED_CANVAS"
+
+MAGIC = int.from_bytes(b"PIXCANV1", "little")
+HEADER_SLOTS = 16  # uint64 slots
+# Header slots: identity and geometry, checked on attach ...
+SLOT_MAGIC, SLOT_WIDTH, SLOT_HEIGHT, SLOT_TILE_SIZE, SLOT_LOG_CAPACITY = range(5)
+# ... then the shared state: change log cursor and floor, total pixels
+SLOT_LOG_STATE = 6
+SLOT_TOTAL_PIXELS = 8
+
+def _align(offset: int) -> int:
+    return (offset + 63) & ~63
+
+class FileLock:
+    """Exclusive flock on a file descriptor; excludes every other process that opened the file.
+
+    It is held only around synchronous array updates, never across an await,
+    so it needs no reentrancy and never blocks for more than microseconds.
+    """
+
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def __enter__(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+class SharedCanvas:
+    """The canvas framebuffer, tile checksums and change log in one memory-mapped file.
+
+    The launcher creates and loads the file before starting the uvicorn workers;
+    each worker maps it and points canvas_buffer, change_log and canvas_counters
+    at views of it. Writers serialize on an flock of the file, readers take no
+    lock, so a pixel committed in one worker is served by all of them at once.
+    """
+
+    def __init__(self, path: str, create: bool = False):
+        self.path = path
+        width, height, tile_size = settings.canvas_width, settings.canvas_height, settings.tile_size
+        tiles_x = (width + tile_size - 1) // tile_size
+        tiles_y = (height + tile_size - 1) // tile_size
+        log_capacity = settings.change_log_size
+
+        rgb_offset = _align(HEADER_SLOTS * 8)
+        present_offset = _align(rgb_offset + height * width * 3)
+        checksums_offset = _align(present_offset + height * width)
+        log_offset = _align(checksums_offset + tiles_y * tiles_x * 8)
+        size = log_offset + log_capacity * CHANGE_DTYPE.itemsize
+
+        self.fd = os.open(path, os.O_RDWR | (os.O_CREAT | os.O_TRUNC if create else 0), 0o600)
+        if create:
+            os.ftruncate(self.fd, size)
+        elif os.fstat(self.fd).st_size != size:
+            os.close(self.fd)
+            raise RuntimeError(f"{path} was created for a different canvas configuration")
+        self.map = mmap.mmap(self.fd, size)
+
+        self.header = np.frombuffer(self.map, dtype=np.uint64, count=HEADER_SLOTS)
+        geometry = [MAGIC, width, height, tile_size, log_capacity]
+        if create:
+            self.header[:len(geometry)] = geometry
+        elif self.header[:len(geometry)].tolist() != geometry:
+            raise RuntimeError(f"{path} was created for a different canvas configuration")
+
+        self.rgb = np.frombuffer(self.map, dtype=np.uint8, count=height * width * 3, offset=rgb_offset).reshape(height, width, 3)
+        self.present = np.frombuffer(self.map, dtype=bool, count=height * width, offset=present_offset).reshape(height, width)
+        self.tile_checksums = np.frombuffer(self.map, dtype=np.uint64, count=tiles_y * tiles_x, offset=checksums_offset).reshape(tiles_y, tiles_x)
+        self.log_entries = np.frombuffer(self.map, dtype=CHANGE_DTYPE, count=log_capacity, offset=log_offset)
+        self.log_state = self.header[SLOT_LOG_STATE:SLOT_LOG_STATE + 2]
+        self.total_pixels = self.header[SLOT_TOTAL_PIXELS:SLOT_TOTAL_PIXELS + 1].view(np.int64)
+        self.write_lock = FileLock(self.fd)
+        self._leader_fd: Optional[int] = None
+
+    def attach_all(self):
+        """Point the process-wide canvas state at this segment"""
+        canvas_buffer.attach(self.rgb, self.present, self.tile_checksums, self.write_lock)
+        change_log.attach(self.log_entries, self.log_state, self.write_lock)
+        canvas_counters.attach(self.total_pixels, self.write_lock)
+
+    def try_lead(self) -> bool:
+        """Try to become the worker that runs shared background maintenance"""
+        if self._leader_fd is not None:
+            return True
+        fd = os.open(self.path + ".leader", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        # Held until this process exits, when the kernel hands it to the next worker
+        self._leader_fd = fd
+        return True
+
+    def unlink(self):
+        for path in (self.path, self.path + ".leader"):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+# The segment this worker is attached to, if any
+shared_canvas: Optional[SharedCanvas] = None
+
+def attach_shared_canvas() -> bool:
+    """Attach to the launcher's shared canvas; False when running as a single process"""
+    global shared_canvas
+    path = os.environ.get(SHARED_CANVAS_ENV)
+    if not path:
+        return False
+    shared_canvas = SharedCanvas(path)
+    shared_canvas.attach_all()
+    logger.info(f"Attached to shared canvas {path} at change {change_log.cursor}")
+    return True
+
+def is_maintenance_leader() -> bool:
+    """Whether this process should run once-per-deployment background work"""
+    return shared_canvas is None or shared_canvas.try_lead()
+
+def is_multi_worker() -> bool:
+    """Whether this process is one of several workers sharing the canvas"""
+    return shared_canvas is not None